@@ -0,0 +1,347 @@
+import os
+import sys
+import io
+import csv
+import json
+import time
+import base64
+import shutil
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+import statistics
+import importlib
+import gzip
+import logging
+import threading
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EPISODES_PER_SEASON = 25
+
+# The tests' stand-in for ffmpeg: it answers probes and writes the files it is asked for, so the
+# benchmark can measure the Python side of the pipeline without any encoding cost.
+FAKE_FFMPEG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'fake_ffmpeg.py')
+
+
+def load_pipeline(ffmpeg_path, work_dir):
+    """Return a freshly loaded process_index module (so each run starts with clean state).
+
+    The media cache (probes and parsed cues) lives in `work_dir` and starts empty, so timings
+    stay comparable across runs and the user's ~/.memesrc/cache is left alone.
+    """
+    module = importlib.reload(importlib.import_module('process_index'))
+    module.set_ffmpeg_path(ffmpeg_path)
+    media_cache_path = os.path.join(work_dir, 'media-cache.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(media_cache_path + suffix):
+            os.remove(media_cache_path + suffix)
+    module.cfg['media_cache_path'] = media_cache_path
+    return module
+
+
+def srt_timestamp(seconds):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+
+
+def write_srt(path, duration, lines_per_minute, rng):
+    """Write an SRT with dialogue spread over `duration` seconds at roughly the given density."""
+    count = max(1, int(duration / 60 * lines_per_minute))
+    spacing = duration / count
+    with open(path, 'w', encoding='utf-8') as srt_file:
+        for index in range(count):
+            start = index * spacing + rng.uniform(0, spacing * 0.2)
+            end = min(duration, start + rng.uniform(0.8, max(0.9, spacing * 1.1)))
+            words = ' '.join(rng.choice(('well', 'you', 'know', 'what', 'I', 'mean', 'right', 'now', 'okay', 'listen')) for _ in range(rng.randint(2, 9)))
+            srt_file.write(f"{index + 1}\n{srt_timestamp(start)} --> {srt_timestamp(end)}\n{words}\n\n")
+
+
+def generate_library(root, episodes, duration, lines_per_minute, ffmpeg_path=None, seed=0):
+    """Create `episodes` videos with matching SRTs under root/Show.
+
+    With a real ffmpeg one testsrc clip is encoded and hard-linked (or copied) for every episode;
+    otherwise the videos are small placeholders for the fake ffmpeg.
+    """
+    rng = random.Random(seed)
+    show_dir = os.path.join(root, 'Show')
+    os.makedirs(os.path.dirname(root), exist_ok=True)
+    os.makedirs(show_dir, exist_ok=True)
+    template = None
+    if ffmpeg_path:
+        # Kept outside the library so discovery doesn't pick it up as an episode
+        template = os.path.join(os.path.dirname(root), f'template-{duration}s.mkv')
+        subprocess.run([
+            ffmpeg_path, '-y', '-hide_banner', '-loglevel', 'error',
+            '-f', 'lavfi', '-i', f'testsrc=duration={duration}:size=1280x720:rate=24',
+            '-c:v', 'libx264', '-preset', 'ultrafast', template
+        ], check=True)
+
+    for number in range(episodes):
+        season_num, episode_num = number // EPISODES_PER_SEASON + 1, number % EPISODES_PER_SEASON + 1
+        name = f"Show.S{season_num:02d}E{episode_num:02d}"
+        video_path = os.path.join(show_dir, f"{name}.mkv")
+        if template:
+            try:
+                os.link(template, video_path)
+            except OSError:
+                shutil.copyfile(template, video_path)
+        else:
+            with open(video_path, 'wb') as video:
+                video.write(b'placeholder')  # Empty files are rejected by the probe stage
+        write_srt(os.path.join(show_dir, f"{name}.srt"), duration, lines_per_minute, rng)
+    return root
+
+
+def generate_docs_tree(root, rows, rows_per_episode=700, seed=0):
+    """Write per-episode _docs.csv files under root/<season>/<episode>/ totalling about `rows` rows."""
+    rng = random.Random(seed)
+    text = [base64.b64encode(f"line {n} of synthetic dialogue".encode()).decode() for n in range(64)]
+    episodes = max(1, rows // rows_per_episode)
+    for number in range(episodes):
+        season_num, episode_num = number // EPISODES_PER_SEASON + 1, number % EPISODES_PER_SEASON + 1
+        episode_dir = os.path.join(root, str(season_num), str(episode_num))
+        os.makedirs(episode_dir, exist_ok=True)
+        with open(os.path.join(episode_dir, '_docs.csv'), 'w', newline='', encoding='utf-8') as csvfile:
+            csv_writer = csv.writer(csvfile)
+            csv_writer.writerow(['season', 'episode', 'subtitle_index', 'subtitle_text', 'start_frame', 'end_frame'])
+            frame = 0
+            for index in range(rows_per_episode):
+                frame += rng.randint(5, 60)
+                csv_writer.writerow([season_num, episode_num, index, rng.choice(text), frame, frame + rng.randint(8, 40)])
+    return episodes
+
+
+def summarize(name, scale, samples):
+    samples = sorted(samples)
+    return {
+        "benchmark": name,
+        "scale": scale,
+        "calls": len(samples),
+        "total_seconds": round(sum(samples), 6),
+        "mean_seconds": round(statistics.mean(samples), 6) if samples else None,
+        "p50_seconds": round(samples[len(samples) // 2], 6) if samples else None,
+        "p95_seconds": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 6) if samples else None,
+    }
+
+
+def time_calls(module, names):
+    """Wrap module functions so every call's duration is recorded; returns {name: [seconds]}."""
+    samples = {name: [] for name in names}
+    for name in names:
+        original = getattr(module, name)
+
+        def timed(*args, _original=original, _samples=samples[name], **kwargs):
+            started = time.perf_counter()
+            try:
+                return _original(*args, **kwargs)
+            finally:
+                _samples.append(time.perf_counter() - started)
+
+        setattr(module, name, timed)
+    return samples
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def bench_pipeline(ffmpeg_path, scale, work_dir, duration, lines_per_minute, real_ffmpeg):
+    pipeline = load_pipeline(ffmpeg_path, work_dir)
+    library = generate_library(os.path.join(work_dir, f'library-{scale}'), scale, duration, lines_per_minute,
+                               ffmpeg_path if real_ffmpeg else None)
+    frames_base_dir = os.path.join(work_dir, f'frames-{scale}')
+    os.makedirs(frames_base_dir, exist_ok=True)
+    pipeline.set_cpu_budget(os.cpu_count() or 1)
+
+    samples = time_calls(pipeline, [
+        'list_content_files', 'process_episode', 'extract_subtitle_clips', 'zip_video_clips',
+        'write_aggregated_csv', 'update_aggregated_csv'
+    ])
+    with redirect_stdout(io.StringIO()):
+        pipeline.set_input_path(library)
+        content_files = pipeline.list_content_files()
+        pipeline.initialize_job_status(content_files, frames_base_dir)
+        pipeline.process_episodes(content_files, frames_base_dir, workers=1)
+        pipeline.aggregate_docs_csv(frames_base_dir)
+        # aggregate_csv_data is a generator drained by write_aggregated_csv, so the
+        # write_aggregated_csv samples cover both
+        pipeline.aggregate_docs_csv(frames_base_dir, full=True)
+
+    results = [summarize(name, scale, values) for name, values in samples.items() if values]
+    shutil.rmtree(library, ignore_errors=True)
+    shutil.rmtree(frames_base_dir, ignore_errors=True)
+    return results
+
+
+def bench_aggregation(ffmpeg_path, rows, work_dir):
+    pipeline = load_pipeline(ffmpeg_path, work_dir)
+    frames_base_dir = os.path.join(work_dir, 'aggregation')
+    episodes = generate_docs_tree(frames_base_dir, rows)
+    scale = episodes * 700
+    results = []
+
+    started = time.perf_counter()
+    pipeline.aggregate_docs_csv(frames_base_dir, full=True)
+    results.append(summarize('aggregate_full', scale, [time.perf_counter() - started]))
+
+    started = time.perf_counter()
+    pipeline.update_aggregated_csv(frames_base_dir)
+    results.append(summarize('aggregate_incremental_initial', scale, [time.perf_counter() - started]))
+
+    started = time.perf_counter()
+    pipeline.update_aggregated_csv(frames_base_dir)
+    results.append(summarize('aggregate_incremental_unchanged', scale, [time.perf_counter() - started]))
+
+    generate_docs_tree(os.path.join(work_dir, 'extra'), 700, seed=1)
+    last_season = str((episodes - 1) // EPISODES_PER_SEASON + 1)
+    new_episode = os.path.join(frames_base_dir, last_season, str(EPISODES_PER_SEASON + 1))
+    shutil.copytree(os.path.join(work_dir, 'extra', '1', '1'), new_episode)
+    started = time.perf_counter()
+    pipeline.update_aggregated_csv(frames_base_dir)
+    results.append(summarize('aggregate_incremental_one_new_episode', scale, [time.perf_counter() - started]))
+
+    for result in results:
+        result["peak_rss_mb"] = peak_rss_mb()
+    shutil.rmtree(frames_base_dir, ignore_errors=True)
+    return results
+
+
+class StandInBulkHandler(BaseHTTPRequestHandler):
+    """Local stand-in for an OpenSearch _bulk endpoint that answers every `reject_every`th request with 429."""
+
+    reject_every = 5
+    requests = 0
+    documents = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        cls = type(self)
+        cls.requests += 1
+        if cls.reject_every and cls.requests % cls.reject_every == 0:
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.end_headers()
+            return
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        count = body.count(b'\n') // 2
+        cls.documents += count
+        reply = json.dumps({"errors": False, "items": [{"index": {"status": 201}}] * count}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+
+def bench_export(ffmpeg_path, rows, work_dir):
+    pipeline = load_pipeline(ffmpeg_path, work_dir)
+    frames_base_dir = os.path.join(work_dir, 'export')
+    episodes = generate_docs_tree(frames_base_dir, rows)
+    scale = episodes * 700
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInBulkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_port}"
+    results = []
+    try:
+        for name, incremental in (('export_bulk_gzip', False), ('export_bulk_incremental_unchanged', True)):
+            uploader = pipeline.BulkUploader(endpoint, backoff=0.01)
+            started = time.perf_counter()
+            pipeline.export_bulk(frames_base_dir, 'bench', uploader, compress=True, incremental=incremental)
+            results.append(summarize(name, scale, [time.perf_counter() - started]))
+    finally:
+        server.shutdown()
+    for result in results:
+        result["peak_rss_mb"] = peak_rss_mb()
+    shutil.rmtree(frames_base_dir, ignore_errors=True)
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r') as file:
+        baseline = {(row["benchmark"], row["scale"]): row for row in json.load(file)["results"]}
+    print(f"\n{'benchmark':<40}{'scale':>10}{'baseline s':>14}{'current s':>14}{'ratio':>8}")
+    for row in results:
+        previous = baseline.get((row["benchmark"], row["scale"]))
+        if previous and previous["total_seconds"]:
+            ratio = row["total_seconds"] / previous["total_seconds"]
+            flag = '  <-- slower' if ratio > 1.1 else ''
+            print(f"{row['benchmark']:<40}{row['scale']:>10}{previous['total_seconds']:>14.3f}{row['total_seconds']:>14.3f}{ratio:>8.2f}{flag}")
+
+
+def run_benchmarks(options):
+    work_dir = options.work_dir or tempfile.mkdtemp(prefix='memesrc-bench-')
+    os.makedirs(work_dir, exist_ok=True)
+    logging.basicConfig(filename=os.path.join(work_dir, 'bench_log.txt'), level=logging.INFO)
+    real_ffmpeg = options.ffmpeg is not None
+    ffmpeg_path = options.ffmpeg or FAKE_FFMPEG
+
+    results = []
+    try:
+        for scale in options.scales:
+            print(f"Pipeline benchmark: {scale} episodes ({'ffmpeg' if real_ffmpeg else 'fake ffmpeg'})")
+            results += bench_pipeline(ffmpeg_path, scale, work_dir, options.duration, options.lines_per_minute, real_ffmpeg)
+        if options.aggregation_rows:
+            print(f"Aggregation benchmark: {options.aggregation_rows} rows")
+            results += bench_aggregation(ffmpeg_path, options.aggregation_rows, work_dir)
+        if options.export_rows:
+            print(f"Bulk export benchmark: {options.export_rows} rows to a local stand-in endpoint")
+            results += bench_export(ffmpeg_path, options.export_rows, work_dir)
+    finally:
+        if not options.keep and not options.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "revision": git_revision(),
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": "real" if real_ffmpeg else "fake",
+        "results": results,
+    }
+    with open(options.output, 'w') as file:
+        json.dump(report, file, indent=4)
+
+    for row in results:
+        print(f"{row['benchmark']:<40}{row['scale']:>10}{row['calls']:>8} calls {row['total_seconds']:>12.3f}s total")
+    print(f"\nResults written to {options.output}")
+    if options.compare:
+        compare(results, options.compare)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the indexing pipeline on synthetic libraries.')
+    parser.add_argument('--ffmpeg', help='Path to a real ffmpeg; without it a fake ffmpeg measures pure Python overhead')
+    parser.add_argument('--scales', type=lambda value: [int(n) for n in value.split(',')], default=[10, 100, 1000], help='Comma-separated episode counts')
+    parser.add_argument('--duration', type=int, default=60, help='Length of each synthetic episode in seconds')
+    parser.add_argument('--lines_per_minute', type=float, default=15.5, help='Subtitle density (about 700 lines per 45 minutes)')
+    parser.add_argument('--aggregation_rows', type=int, default=5_000_000, help='Rows in the synthetic _docs.csv tree (0 to skip)')
+    parser.add_argument('--export_rows', type=int, default=500_000, help='Rows exported to a local stand-in bulk endpoint (0 to skip)')
+    parser.add_argument('--output', default='bench_results.json', help='Where to write the JSON results')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    parser.add_argument('--work_dir', help='Directory for generated data (kept); defaults to a temp directory')
+    parser.add_argument('--keep', action='store_true', help='Keep the temp directory with generated data')
+    run_benchmarks(parser.parse_args())
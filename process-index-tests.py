@@ -1,101 +1,328 @@
 import os
-from pathlib import Path
+import re
+import sys
 import csv
+import json
+import time
+import zipfile
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
-def check_directory_structure(base_dir):
-    success = True
+from process_index import (get_frames_dir, numeric_sort_key, read_clip_index, DOCS_FIELDNAMES,
+                           CLIP_PACK_NAME, CLIP_INDEX_NAME)
+
+CLIPS_PER_ZIP = 15  # zip_video_clips() puts s{N}.mp4 in s{N // 15}.zip
+SEGMENT_PATTERN = re.compile(r"([0-9]+)\.mp4")
+SUBTITLE_CLIP_PATTERN = re.compile(r"s([0-9]+)\.mp4")
+CLIP_ZIP_PATTERN = re.compile(r"s([0-9]+)\.zip")
+
+
+def numbered_dirs(directory):
+    """Return the numerically named subdirectories (seasons or episodes) of a directory in order."""
+    with os.scandir(directory) as entries:
+        dirs = [entry for entry in entries if entry.is_dir() and entry.name.isdigit()]
+    return [entry.path for entry in sorted(dirs, key=lambda entry: numeric_sort_key(entry.name))]
+
+
+def scan_docs_csv(csv_file, season=None, episode=None):
+    """Stream a _docs.csv once and return (row_count, duplicate_headers, max_end_frame, problems).
+
+    Subtitle text is base64, so every record is exactly one line and rows can be checked as
+    they are read without holding the file in memory.
+    """
+    rows, duplicate_headers, max_end_frame, problems = 0, False, -1, []
+    with open(csv_file, 'r', newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        headers = next(reader, None)
+        if headers != DOCS_FIELDNAMES:
+            return 0, False, -1, [f"Unexpected header in {csv_file}: {headers}"]
+        for line_number, row in enumerate(reader, start=2):
+            if row == headers:
+                duplicate_headers = True
+                continue
+            try:
+                row_season, row_episode, index, _, start_frame, end_frame = row
+                row_season, row_episode, index = int(row_season), int(row_episode), int(index)
+                start_frame, end_frame = int(start_frame), int(end_frame)
+            except ValueError:
+                problems.append(f"Malformed row at line {line_number} of {csv_file}")
+                continue
+            if episode is not None:
+                if (row_season, row_episode) != (season, episode):
+                    problems.append(f"Row at line {line_number} of {csv_file} is for S{row_season}E{row_episode}")
+                elif index != rows:
+                    problems.append(f"Row at line {line_number} of {csv_file} has subtitle_index {index}, expected {rows}")
+            # get_frame_index() writes -1 for cues that start in the first frame interval
+            if not -1 <= start_frame <= end_frame:
+                problems.append(f"Bad frame range {start_frame}-{end_frame} at line {line_number} of {csv_file}")
+            max_end_frame = max(max_end_frame, end_frame)
+            rows += 1
+    return rows, duplicate_headers, max_end_frame, problems[:20]
+
+
+def check_clip_zips(episode_path, expected_clips, zip_files):
+    """Check each s{N}.zip holds exactly its share of the expected clips and passes its CRCs."""
     messages = []
-    csv_files_with_duplicate_headers = []
+    expected_groups = {}
+    for number in expected_clips:
+        expected_groups.setdefault(number // CLIPS_PER_ZIP, set()).add(f"s{number}.mp4")
+
+    for group in sorted(set(expected_groups) - set(zip_files)):
+        messages.append(f"Missing s{group}.zip in {episode_path}")
+    for group in sorted(set(zip_files) - set(expected_groups)):
+        messages.append(f"Unexpected s{group}.zip in {episode_path}")
+    for group in sorted(set(zip_files) & set(expected_groups)):
+        zip_path = os.path.join(episode_path, zip_files[group])
+        try:
+            with zipfile.ZipFile(zip_path) as archive:
+                members = {info.filename: info for info in archive.infolist()}
+                missing = expected_groups[group] - set(members)
+                extra = set(members) - expected_groups[group]
+                if missing:
+                    messages.append(f"{zip_path} is missing {', '.join(sorted(missing, key=numeric_sort_key))}")
+                if extra:
+                    messages.append(f"{zip_path} has unexpected {', '.join(sorted(extra, key=numeric_sort_key))}")
+                empty = [name for name, info in members.items() if info.file_size == 0]
+                if empty:
+                    messages.append(f"{zip_path} has empty clips: {', '.join(sorted(empty, key=numeric_sort_key))}")
+                bad_member = archive.testzip()
+                if bad_member:
+                    messages.append(f"CRC mismatch for {bad_member} in {zip_path}")
+        except (zipfile.BadZipFile, OSError) as error:
+            messages.append(f"Unreadable zip {zip_path}: {error}")
+    return messages
 
-    if not os.path.exists(base_dir):
-        return False, [f"Base directory {base_dir} does not exist."], []
 
-    # Check the top-level CSV file
-    top_level_csv = os.path.join(base_dir, '_docs.csv')
-    if not os.path.isfile(top_level_csv) or os.stat(top_level_csv).st_size == 0:
-        success = False
-        messages.append(f"Missing or empty _docs.csv in {base_dir}")
+def check_clip_pack(episode_path, expected_clips):
+    """Check _clips.idx lists exactly the expected clips and every range is an mp4 inside _clips.pack."""
+    messages = []
+    pack_path = os.path.join(episode_path, CLIP_PACK_NAME)
+    try:
+        index = read_clip_index(episode_path)
+        pack_size = os.path.getsize(pack_path)
+    except (ValueError, OSError) as error:
+        return [f"Unreadable clip pack in {episode_path}: {error}"]
+
+    missing = sorted(set(expected_clips) - set(index))
+    extra = sorted(set(index) - set(expected_clips))
+    if missing:
+        messages.append(f"{pack_path} is missing clips {', '.join(f's{n}' for n in missing)}")
+    if extra:
+        messages.append(f"{pack_path} has unexpected clips {', '.join(f's{n}' for n in extra)}")
+    with open(pack_path, 'rb') as pack:
+        end_of_previous = 0
+        for number, (offset, length) in sorted(index.items(), key=lambda item: item[1][0]):
+            if length == 0 or offset < end_of_previous or offset + length > pack_size:
+                messages.append(f"Clip s{number} has a bad byte range {offset}+{length} in {pack_path}")
+                continue
+            pack.seek(offset + 4)
+            if pack.read(4) != b"ftyp":
+                messages.append(f"Clip s{number} in {pack_path} does not start with an mp4 header")
+            end_of_previous = offset + length
+    return messages
+
+
+def check_episode(episode_path, season, episode, fps=10, clip_duration=25):
+    """Validate one episode directory and return a result dict for the report."""
+    result = {"path": episode_path, "season": season, "episode": episode, "errors": [], "warnings": [],
+              "rows": 0, "segments": 0, "duplicate_headers": False}
+    errors = result["errors"]
+
+    segments, loose_clips, zip_files = [], [], {}
+    with os.scandir(episode_path) as entries:
+        for entry in entries:
+            if SEGMENT_PATTERN.fullmatch(entry.name):
+                segments.append((int(SEGMENT_PATTERN.fullmatch(entry.name).group(1)), entry.stat().st_size))
+            elif SUBTITLE_CLIP_PATTERN.fullmatch(entry.name):
+                loose_clips.append(entry.name)
+            elif CLIP_ZIP_PATTERN.fullmatch(entry.name):
+                zip_files[int(CLIP_ZIP_PATTERN.fullmatch(entry.name).group(1))] = entry.name
+    has_pack = os.path.exists(os.path.join(episode_path, CLIP_INDEX_NAME))
+
+    # Video segments: 0.mp4 ... (K-1).mp4, none empty
+    result["segments"] = len(segments)
+    if not segments:
+        errors.append(f"No video segments found in {episode_path}")
     else:
-        if has_duplicate_headers(top_level_csv):
-            csv_files_with_duplicate_headers.append(top_level_csv)
-
-    for season_dir in sorted(Path(base_dir).iterdir(), key=lambda x: (x.name.isdigit(), int(x.name) if x.name.isdigit() else x.name)):
-        if season_dir.is_dir():
-            season_path = str(season_dir)
-            docs_csv = os.path.join(season_path, '_docs.csv')
-            if not os.path.isfile(docs_csv) or os.stat(docs_csv).st_size == 0:
-                success = False
-                messages.append(f"Missing or empty _docs.csv in {season_path}")
-            else:
-                if has_duplicate_headers(docs_csv):
-                    csv_files_with_duplicate_headers.append(docs_csv)
-
-            for episode_dir in sorted(season_dir.iterdir(), key=lambda x: (x.name.isdigit(), int(x.name) if x.name.isdigit() else x.name)):
-                if episode_dir.is_dir():
-                    episode_path = str(episode_dir)
-                    episode_docs_csv = os.path.join(episode_path, '_docs.csv')
-                    if not os.path.isfile(episode_docs_csv) or os.stat(episode_docs_csv).st_size == 0:
-                        success = False
-                        messages.append(f"Missing or empty _docs.csv in {episode_path}")
-                    else:
-                        if has_duplicate_headers(episode_docs_csv):
-                            csv_files_with_duplicate_headers.append(episode_docs_csv)
-
-                    video_clips = list(episode_dir.glob('*.mp4'))
-                    if not video_clips:
-                        success = False
-                        messages.append(f"No video clips found in {episode_path}")
-                    else:
-                        for clip in video_clips:
-                            if os.stat(clip).st_size == 0:
-                                success = False
-                                messages.append(f"Empty video clip found: {clip}")
-
-    return success, messages, csv_files_with_duplicate_headers
+        numbers = sorted(number for number, _ in segments)
+        if numbers != list(range(len(numbers))):
+            missing = sorted(set(range(numbers[-1] + 1)) - set(numbers))
+            errors.append(f"Missing video segments {', '.join(f'{n}.mp4' for n in missing)} in {episode_path}")
+        errors.extend(f"Empty video segment: {os.path.join(episode_path, f'{number}.mp4')}" for number, size in segments if size == 0)
+    if loose_clips:
+        errors.append(f"{len(loose_clips)} subtitle clip(s) were never stored in {episode_path}")
+
+    docs_csv = os.path.join(episode_path, '_docs.csv')
+    if not os.path.isfile(docs_csv) or os.stat(docs_csv).st_size == 0:
+        if zip_files or has_pack:
+            errors.append(f"Missing or empty _docs.csv in {episode_path}")
+        else:
+            result["warnings"].append(f"No subtitles indexed for {episode_path}")
+        return result
+
+    rows, duplicate_headers, max_end_frame, problems = scan_docs_csv(docs_csv, season, episode)
+    result.update(rows=rows, duplicate_headers=duplicate_headers)
+    errors.extend(problems)
+
+    # Subtitle frames must fall inside the segments (allowing a second for a line that outlasts the video)
+    frames_covered = len(segments) * clip_duration * fps
+    if segments and max_end_frame >= frames_covered + fps:
+        errors.append(f"_docs.csv in {episode_path} ends at frame {max_end_frame} but {len(segments)} segment(s) "
+                      f"only cover {frames_covered} frames at {fps} fps")
+
+    expected_clips = range(1, rows + 1)
+    if has_pack:
+        errors.extend(check_clip_pack(episode_path, expected_clips))
+    else:
+        errors.extend(check_clip_zips(episode_path, expected_clips, zip_files))
+    return result
+
+
+def check_aggregate(directory, expected_rows):
+    """Check an aggregated _docs.csv exists, has no repeated headers and holds `expected_rows` rows."""
+    result = {"path": directory, "errors": [], "warnings": [], "rows": 0, "duplicate_headers": False}
+    docs_csv = os.path.join(directory, '_docs.csv')
+    if not os.path.isfile(docs_csv) or os.stat(docs_csv).st_size == 0:
+        if expected_rows:
+            result["errors"].append(f"Missing or empty _docs.csv in {directory}")
+        return result
+    rows, duplicate_headers, _, problems = scan_docs_csv(docs_csv)
+    result.update(rows=rows, duplicate_headers=duplicate_headers)
+    result["errors"].extend(problems)
+    if rows != expected_rows:
+        result["errors"].append(f"_docs.csv in {directory} has {rows} rows but its episodes have {expected_rows}")
+    return result
+
+
+def check_job_status(base_dir):
+    status_path = os.path.join(base_dir, 'processing_status.json')
+    if not os.path.exists(status_path):
+        return [f"Missing processing_status.json in {base_dir}"]
+    with open(status_path, 'r') as file:
+        status = json.load(file)
+    return [
+        f"{season}, {episode} is {state}"
+        for season, episodes in status.get("episodes", {}).items()
+        for episode, state in episodes.items() if state != "completed"
+    ]
+
+
+def check_directory_structure(base_dir, workers=None, fps=10, clip_duration=25):
+    """Validate a processed index and return a report dict.
+
+    Episodes are checked in parallel (zip CRC checks spend their time in zlib, which releases
+    the GIL), then each season's and the top-level aggregated _docs.csv are checked against the
+    row counts of the episodes under them.
+    """
+    started = time.perf_counter()
+    report = {"base_dir": base_dir, "success": False, "episodes_checked": 0, "rows": 0,
+              "errors": [], "warnings": [], "duplicate_headers": []}
+    if not os.path.exists(base_dir):
+        report["errors"].append(f"Base directory {base_dir} does not exist.")
+        return report
+
+    seasons = {season_path: numbered_dirs(season_path) for season_path in numbered_dirs(base_dir)}
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        episode_futures = {
+            season_path: [
+                executor.submit(check_episode, episode_path, int(os.path.basename(season_path)),
+                                int(os.path.basename(episode_path)), fps, clip_duration)
+                for episode_path in episode_paths
+            ]
+            for season_path, episode_paths in seasons.items()
+        }
+        results = []
+        season_rows = {}
+        for season_path, futures in episode_futures.items():
+            season_results = [future.result() for future in futures]
+            season_rows[season_path] = sum(result["rows"] for result in season_results)
+            results.extend(season_results)
+        aggregate_futures = [executor.submit(check_aggregate, season_path, rows) for season_path, rows in season_rows.items()]
+        aggregate_futures.append(executor.submit(check_aggregate, base_dir, sum(season_rows.values())))
+        results.extend(future.result() for future in aggregate_futures)
+
+    for result in results:
+        report["errors"].extend(result["errors"])
+        report["warnings"].extend(result["warnings"])
+        if result["duplicate_headers"]:
+            report["duplicate_headers"].append(os.path.join(result["path"], '_docs.csv'))
+    report["errors"].extend(check_job_status(base_dir))
+    report["episodes_checked"] = sum(len(episode_paths) for episode_paths in seasons.values())
+    report["rows"] = sum(season_rows.values())
+    report["success"] = not report["errors"]
+    report["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    return report
 
 
 def has_duplicate_headers(csv_file):
-    with open(csv_file, 'r') as file:
-        reader = csv.reader(file)
-        headers = next(reader)
-        return any(row == headers for row in reader)
+    with open(csv_file, 'r', newline='', encoding='utf-8') as file:
+        headers = file.readline()
+        return any(line == headers for line in file)
 
 
 def fix_duplicate_headers(csv_file):
-    with open(csv_file, 'r') as file:
-        lines = file.readlines()
+    """Drop every repeat of the header line, streaming into a temporary file that replaces the original."""
+    temp_path = csv_file + '.tmp'
+    with open(csv_file, 'r', newline='', encoding='utf-8') as source, open(temp_path, 'w', newline='', encoding='utf-8') as target:
+        headers = source.readline()
+        target.write(headers)  # Write the header line
+        target.writelines(line for line in source if line != headers)
+    os.replace(temp_path, csv_file)
+
 
-    with open(csv_file, 'w') as file:
-        file.write(lines[0])  # Write the header line
-        file.writelines(lines[2:])  # Write the remaining lines, skipping the duplicate header
+def run_checks(base_dir, workers=None, fps=10, clip_duration=25, fix=None, as_json=False):
+    """Check `base_dir`, print the results and return True when it passed.
 
+    `fix` removes duplicate headers without asking; None asks when running at a terminal.
+    """
+    if not as_json:
+        print("Starting post-processing checks...\n")
+    report = check_directory_structure(base_dir, workers, fps, clip_duration)
 
-def run_checks(base_dir):
-    print("Starting post-processing checks...\n")
-    success, messages, csv_files_with_duplicate_headers = check_directory_structure(base_dir)
+    if report["duplicate_headers"] and fix is None and not as_json and sys.stdin.isatty():
+        print("\033[93mWarning: Duplicate headers found in the following CSV files:\033[0m")
+        for file in report["duplicate_headers"]:
+            print(file)
+        fix = input("\nDo you want to fix the duplicate headers? (y/n): ").lower() == 'y'
+    if fix and report["duplicate_headers"]:
+        for file in report["duplicate_headers"]:
+            fix_duplicate_headers(file)
+        report["fixed_duplicate_headers"] = True
 
-    if success:
-        print("\033[92mAll good! The directory structure and file contents meet expectations.\033[0m")
+    if as_json:
+        print(json.dumps(report, indent=4))
+        return report["success"]
+
+    if report["success"]:
+        print(f"\033[92mAll good! {report['episodes_checked']} episode(s) and {report['rows']} subtitle rows meet expectations.\033[0m")
     else:
         print("\033[91mIssues detected during the checks:\033[0m")
-        for message in messages:
+        for message in report["errors"]:
             print(message)
-
-    if csv_files_with_duplicate_headers:
-        print("\n\033[93mWarning: Duplicate headers found in the following CSV files:\033[0m")
-        for file in csv_files_with_duplicate_headers:
-            print(file)
-
-        user_input = input("\nDo you want to fix the duplicate headers? (y/n): ")
-        if user_input.lower() == 'y':
-            for file in csv_files_with_duplicate_headers:
-                fix_duplicate_headers(file)
-            print("\033[92mDuplicate headers have been fixed.\033[0m")
-        else:
-            print("Duplicate headers will not be fixed.")
+    for message in report["warnings"]:
+        print(f"\033[93m{message}\033[0m")
+    if report.get("fixed_duplicate_headers"):
+        print("\033[92mDuplicate headers have been fixed.\033[0m")
+    elif report["duplicate_headers"]:
+        print("Duplicate headers will not be fixed.")
+    print(f"\nChecked in {report['elapsed_seconds']}s")
+    return report["success"]
 
 if __name__ == "__main__":
-    id_input = input("Enter the ID for the output folder: ")  # Prompt the user for the ID
-    base_dir = f"~/.memesrc/processing/{id_input}"
-    base_dir = os.path.expanduser(base_dir)  # Ensure the path is expanded to the full path
-    run_checks(base_dir)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Validate a processed memeSRC index.')
+    parser.add_argument('id', nargs='?', help='ID of the output folder (prompted for when omitted)')
+    parser.add_argument('--base_dir', help='Check this directory instead of ~/.memesrc/processing/<id>')
+    parser.add_argument('--json', action='store_true', help='Print a machine-readable JSON report instead of text')
+    parser.add_argument('--fix', action='store_true', help='Remove duplicate CSV headers without asking')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of episodes to check concurrently')
+    parser.add_argument('--fps', type=int, default=10, help='Frames per second the index was built with')
+    parser.add_argument('--clip_duration', type=int, default=25, help='Segment length in seconds the index was built with')
+    args = parser.parse_args()
+
+    if args.base_dir:
+        base_dir = os.path.expanduser(args.base_dir)
+    else:
+        id_input = args.id or input("Enter the ID for the output folder: ")  # Prompt the user for the ID
+        base_dir = get_frames_dir(id_input)
+    passed = run_checks(base_dir, args.workers, args.fps, args.clip_duration, True if args.fix else None, args.json)
+    sys.exit(0 if passed else 1)
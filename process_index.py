@@ -0,0 +1,3245 @@
+import sys
+import os
+import subprocess
+import argparse
+import yaml
+import re
+import csv
+import io
+import base64
+from pathlib import Path
+import srt
+import json
+from datetime import timedelta
+import logging
+import zipfile
+import gzip
+import zlib
+import codecs
+import urllib.request
+import urllib.error
+import threading
+import hashlib
+import heapq
+import array
+import unicodedata
+import mmap
+import struct
+import sqlite3
+import queue
+import socket
+import time
+import tempfile
+import contextvars
+from collections import namedtuple, Counter
+import shutil
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+CONFIG_PATH = os.path.expanduser('~/.memesrc/config.yml')
+cfg = {}
+FFMPEG_PATH = 'ffmpeg'
+SUBTITLE_LANGUAGES = ["eng", "en"]
+input_path = None
+
+def load_config(path=CONFIG_PATH):
+    """Load the YAML config into `cfg` (empty when the file doesn't exist) and return it."""
+    global cfg
+    if os.path.exists(path):
+        with open(path, 'r') as ymlfile:
+            cfg = yaml.safe_load(ymlfile) or {}
+    else:
+        cfg = {}
+    return cfg
+
+def set_ffmpeg_path(path=None):
+    global FFMPEG_PATH
+    FFMPEG_PATH = path or cfg.get('ffmpeg_path', 'ffmpeg')
+
+def set_subtitle_languages(languages=None):
+    """Preferred languages for embedded subtitle tracks, most wanted first (e.g. "eng,en")."""
+    global SUBTITLE_LANGUAGES
+    languages = languages or cfg.get('subtitle_languages') or ["eng", "en"]
+    if isinstance(languages, str):
+        languages = languages.split(',')
+    SUBTITLE_LANGUAGES = [language.strip().lower() for language in languages if language.strip()]
+
+def get_frames_dir(id):
+    return os.path.join(os.path.expanduser(f"~/.memesrc/processing/{id}"))
+
+def setup_logging(log_path):
+    logging.basicConfig(filename=log_path, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+    logging.info("Logging setup complete.")
+
+@contextmanager
+def log_to_file(log_path):
+    """Send the root logger to `log_path` for the duration of one job (used by the worker)."""
+    handler = logging.FileHandler(log_path)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    try:
+        yield
+    finally:
+        root.removeHandler(handler)
+        handler.close()
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Process video content into clips and index subtitles.')
+    parser.add_argument('input_path', nargs='?', help='Input path of the videos and subtitles')
+    parser.add_argument('ffmpeg_path', nargs='?', help='Path to the FFmpeg executable')
+    parser.add_argument('id', nargs='?', help='ID for the output folder')
+    parser.add_argument('--fps', type=int, default=10, help='Frames per second for the output clips')
+    parser.add_argument('--clip_duration', type=int, default=25, help='Duration of each clip in seconds')
+    parser.add_argument('--workers', type=int, default=1, help='Number of episodes to process concurrently')
+    parser.add_argument('--cpu_budget', type=int, default=os.cpu_count() or 1, help='Total ffmpeg threads allowed to run at once across all encodes')
+    parser.add_argument('--subtitle_jobs', type=int, default=0, help='Concurrent subtitle-clip encodes per episode (0 picks one from the CPU budget)')
+    parser.add_argument('--retries', type=int, default=2, help='How many times to retry a failed subtitle-clip encode')
+    parser.add_argument('--clip_store', choices=['zip', 'pack'], default='zip', help='Store subtitle clips as s{N}.zip groups of 15 (zip) or one packed file per episode with an offset index (pack)')
+    parser.add_argument('--profile', help='Encoding profile from ~/.memesrc/config.yml or built in: fast-import, balanced, archival')
+    parser.add_argument('--calibrate', action='store_true', help='Encode a short sample of the library with every encoding profile and report speed and size instead of processing')
+    parser.add_argument('--calibrate_seconds', type=int, default=30, help='Length of the calibration sample in seconds')
+    parser.add_argument('--events', help='Write machine-readable JSONL progress and timing events to this file ("-" for stdout)')
+    parser.add_argument('--full_aggregate', action='store_true', help='Rebuild every aggregated _docs.csv from scratch instead of updating them incrementally')
+    parser.add_argument('--subtitle_extraction', choices=['batched', 'coalesced', 'per-clip'], default='batched', help='Decode each window of subtitles once (batched), encode overlapping or adjacent lines once and stream-copy the clips out (coalesced), or run one ffmpeg per subtitle line (per-clip)')
+    parser.add_argument('--subtitle_languages', help='Comma-separated language preference for embedded subtitle tracks, used when an episode has no .srt next to it (default: eng,en)')
+    parser.add_argument('--search', nargs=2, metavar=('ID', 'QUERY'), help='Search the subtitles of an already processed index offline and print the hits as JSON lines')
+    parser.add_argument('--search_limit', type=int, default=20, help='Maximum number of hits for --search')
+    parser.add_argument('--export', metavar='ID', help='Export the subtitles of an already processed index as NDJSON bulk chunks instead of processing')
+    parser.add_argument('--export_to', help='Directory for the bulk chunk files, or an http(s) OpenSearch endpoint to upload them to (password from OPENSEARCH_PASS)')
+    parser.add_argument('--export_index', help='Search index name for the exported documents (default: v2-<ID>)')
+    parser.add_argument('--export_gzip', action='store_true', help='Gzip each bulk chunk')
+    parser.add_argument('--export_incremental', action='store_true', help='Only export episodes whose _docs.csv changed since the last export to the same index')
+    parser.add_argument('--export_chunk_mb', type=float, default=5, help='Maximum size of one bulk chunk in megabytes (before compression)')
+    parser.add_argument('--queue', action='store_true', help='Split the library with other workers through a shared work queue in the frames folder (see SHARED WORK QUEUE)')
+    parser.add_argument('--frames_dir', help='Write the index here instead of ~/.memesrc/processing/<id>, e.g. a folder every --queue worker can reach')
+    parser.add_argument('--worker_id', help='Name of this --queue worker in leases and events (default: <hostname>-<pid>)')
+    parser.add_argument('--lease_seconds', type=int, default=QUEUE_LEASE_SECONDS, help='Seconds without a heartbeat before a --queue worker is presumed dead and its episodes are handed out again')
+    parser.add_argument('--worker', action='store_true', help='Stay running and take jobs as JSON lines on stdin, streaming events to stdout (see WORKER MODE)')
+    return parser
+
+class EpisodeLogAdapter(logging.LoggerAdapter):
+    """Prefixes log lines with the episode they belong to, e.g. [S01E02]."""
+    def process(self, msg, kwargs):
+        return f"[{self.extra['label']}] {msg}", kwargs
+
+def episode_logger(season_num, episode_num):
+    return EpisodeLogAdapter(logging.getLogger(), {'label': f"S{season_num:02d}E{episode_num:02d}"})
+
+class ClipExtractionError(Exception):
+    """Raised when ffmpeg could not produce every clip an episode needs."""
+
+class JobCancelled(Exception):
+    """Raised inside a job once cancel_running_job() has been called."""
+
+class CpuBudget:
+    """Counts the ffmpeg threads in flight so concurrent encodes never exceed the machine's budget."""
+    def __init__(self, total):
+        self.total = max(1, total)
+        self.available = self.total
+        self.condition = threading.Condition()
+
+    @contextmanager
+    def reserve(self, threads):
+        threads = max(1, min(threads, self.total))
+        with self.condition:
+            self.condition.wait_for(lambda: self.available >= threads)
+            self.available -= threads
+        try:
+            yield threads
+        finally:
+            with self.condition:
+                self.available += threads
+                self.condition.notify_all()
+
+cpu_budget = CpuBudget(os.cpu_count() or 1)
+encode_plan = {"video_threads": 1, "subtitle_jobs": 1, "subtitle_threads": 1}
+
+def set_cpu_budget(total_threads, workers=1, subtitle_jobs=0):
+    """Split `total_threads` between episode workers, their main encode and their subtitle jobs.
+
+    Each episode worker gets an equal share. The main segment encode may use the whole share,
+    and the subtitle encodes divide it so that subtitle_jobs x subtitle_threads ~= share.
+    """
+    global cpu_budget
+    cpu_budget = CpuBudget(total_threads)
+    share = max(1, cpu_budget.total // max(1, workers))
+    jobs = subtitle_jobs if subtitle_jobs > 0 else max(1, share // 2)
+    encode_plan.update({
+        "video_threads": share,
+        "subtitle_jobs": jobs,
+        "subtitle_threads": max(1, share // jobs),
+    })
+
+# ==================
+# INSTRUMENTATION
+# ==================
+#
+# Events are JSON objects, one per line, each with an "event" name and a "time" (unix seconds):
+#   run_start, episode_start, encode_progress, stage, episode, summary
+# (plus job_queued, job_done and request_error in worker mode, where every event carries the
+# "job_id" it belongs to).
+# "stage" covers extract_video_clips ("video"), subtitle clip encoding ("subtitles"), zipping or
+# packing ("store") and "aggregate", with wall time, this thread's Python CPU time, the CPU time
+# of the ffmpeg processes it ran and, for encodes, seconds of media produced and realtime speed.
+
+event_sink = None
+event_context = {}  # Fields added to every event, e.g. the worker's current job_id
+event_lock = threading.Lock()
+current_stage = contextvars.ContextVar('current_stage', default=None)
+run_stats = {}
+
+def reset_run_stats():
+    with event_lock:
+        run_stats.clear()
+        run_stats.update({"stages": {}, "episodes": {}, "clips": 0, "bytes_written": 0})
+
+reset_run_stats()
+
+def set_event_sink(path):
+    """Send events to a file path, "-" for stdout, or an already open stream."""
+    global event_sink
+    if path == '-':
+        event_sink = sys.stdout
+    elif hasattr(path, 'write'):
+        event_sink = path
+    elif path:
+        event_sink = open(path, 'a', encoding='utf-8', buffering=1)
+
+def emit_event(event, **fields):
+    if event_sink is None:
+        return
+    line = json.dumps({"event": event, "time": round(time.time(), 3), **event_context, **fields})
+    with event_lock:
+        event_sink.write(line + "\n")
+        event_sink.flush()
+
+class StageStats:
+    def __init__(self):
+        self.ffmpeg_cpu_seconds = 0.0
+        self.media_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, cpu_seconds, media_seconds):
+        with self.lock:
+            self.ffmpeg_cpu_seconds += cpu_seconds or 0.0
+            self.media_seconds += media_seconds or 0.0
+
+@contextmanager
+def stage_timer(stage, season_num=None, episode_num=None):
+    """Time a pipeline stage and emit a "stage" event for it, even when it raises."""
+    stats = StageStats()
+    token = current_stage.set(stats)
+    wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        yield stats
+    finally:
+        current_stage.reset(token)
+        wall_seconds = time.perf_counter() - wall_start
+        fields = {
+            "stage": stage,
+            "wall_seconds": round(wall_seconds, 3),
+            "cpu_seconds": round(time.thread_time() - cpu_start, 3),
+            "ffmpeg_cpu_seconds": round(stats.ffmpeg_cpu_seconds, 3),
+        }
+        if season_num is not None:
+            fields.update(season=season_num, episode=episode_num)
+        if stats.media_seconds:
+            fields["media_seconds"] = round(stats.media_seconds, 3)
+            fields["speed"] = round(stats.media_seconds / wall_seconds, 2) if wall_seconds else None
+        with event_lock:
+            totals = run_stats["stages"].setdefault(stage, {"count": 0, "wall_seconds": 0.0, "ffmpeg_cpu_seconds": 0.0, "media_seconds": 0.0})
+            totals["count"] += 1
+            totals["wall_seconds"] += wall_seconds
+            totals["ffmpeg_cpu_seconds"] += stats.ffmpeg_cpu_seconds
+            totals["media_seconds"] += stats.media_seconds
+        emit_event("stage", **fields)
+
+def record_episode(season_num, episode_num, status, wall_seconds, episode_dir=None, clips=0):
+    bytes_written = 0
+    if episode_dir and os.path.isdir(episode_dir):
+        with os.scandir(episode_dir) as entries:
+            bytes_written = sum(entry.stat().st_size for entry in entries if entry.is_file())
+    with event_lock:
+        run_stats["episodes"][status] = run_stats["episodes"].get(status, 0) + 1
+        run_stats["clips"] += clips
+        run_stats["bytes_written"] += bytes_written
+    emit_event("episode", season=season_num, episode=episode_num, status=status,
+               wall_seconds=round(wall_seconds, 3), clips=clips, bytes_written=bytes_written)
+
+def emit_run_summary(wall_seconds):
+    with event_lock:
+        summary = json.loads(json.dumps(run_stats))
+    for totals in summary["stages"].values():
+        totals["speed"] = round(totals["media_seconds"] / totals["wall_seconds"], 2) if totals["wall_seconds"] and totals["media_seconds"] else None
+    logging.info(f"Run summary: {json.dumps(summary)}")
+    emit_event("summary", wall_seconds=round(wall_seconds, 3), **summary)
+
+FfmpegResult = namedtuple('FfmpegResult', ['returncode', 'errors', 'cpu_seconds', 'media_seconds', 'speed'])
+
+def wait_for_exit(process):
+    """Wait for a child and return the CPU seconds it used (None where the OS can't say)."""
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return usage.ru_utime + usage.ru_stime
+    process.wait()
+    return None
+
+def parse_progress_number(value, suffix=''):
+    try:
+        return float(value.rstrip(suffix))
+    except (AttributeError, ValueError):
+        return None
+
+# Cancelling a job sets cancel_requested and terminates the ffmpeg processes it is running;
+# run_ffmpeg() then raises JobCancelled, which unwinds the job without stopping the interpreter.
+cancel_requested = threading.Event()
+active_processes = set()
+active_processes_lock = threading.Lock()
+
+def cancel_running_job():
+    cancel_requested.set()
+    with active_processes_lock:
+        for process in active_processes:
+            process.terminate()
+
+def run_ffmpeg(command, threads=1, on_progress=None, media_seconds=None):
+    """Run an ffmpeg command while holding `threads` slots of the CPU budget.
+
+    ffmpeg reports progress as key=value blocks on stdout (-progress pipe:1); each block is
+    passed to `on_progress` and the last one gives the media time produced and realtime speed.
+    That clock only follows one output, so multi-output commands pass the `media_seconds` they
+    produce instead; it is credited to the current stage when ffmpeg exits cleanly.
+    Returns an FfmpegResult so callers can notice and report failures, or raises JobCancelled
+    if the job was cancelled before or while ffmpeg ran.
+    """
+    command = [command[0], "-hide_banner", "-loglevel", "error", "-nostats", "-progress", "pipe:1", *command[1:]]
+    progress = {}
+    with cpu_budget.reserve(threads), tempfile.TemporaryFile() as stderr:
+        if cancel_requested.is_set():
+            raise JobCancelled()
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr, text=True, errors='replace')
+        with active_processes_lock:
+            active_processes.add(process)
+            if cancel_requested.is_set():
+                process.terminate()  # Cancelled between the check above and registering
+        try:
+            block = {}
+            for line in process.stdout:
+                key, _, value = line.strip().partition('=')
+                block[key] = value
+                if key == 'progress':
+                    progress, block = block, {}
+                    if on_progress:
+                        on_progress(progress)
+            process.stdout.close()
+            cpu_seconds = wait_for_exit(process)
+        finally:
+            with active_processes_lock:
+                active_processes.discard(process)
+        if cancel_requested.is_set():
+            raise JobCancelled()
+        stderr.seek(0)
+        errors = stderr.read().decode('utf-8', errors='replace').strip()
+
+    if media_seconds is not None:
+        media_seconds = media_seconds if process.returncode == 0 else 0.0
+    else:
+        out_time_us = parse_progress_number(progress.get('out_time_us'))
+        media_seconds = out_time_us / 1e6 if out_time_us and out_time_us > 0 else 0.0
+    stats = current_stage.get()
+    if stats is not None:
+        stats.add(cpu_seconds, media_seconds)
+    return FfmpegResult(process.returncode, errors, cpu_seconds, media_seconds, parse_progress_number(progress.get('speed'), 'x'))
+
+def set_input_path(path):
+    global input_path
+    input_path = path
+
+# ==================
+# MEDIA DISCOVERY
+# ==================
+
+VIDEO_EXTENSIONS = {".mp4", ".mkv", ".avi", ".mov"}
+SUBTITLE_EXTENSIONS = {".srt"}
+SEASON_EPISODE_PATTERN = re.compile(r'S[0-9]+E[0-9]+|S[0-9]+\.E[0-9]+|[0-9]+x[0-9]+|[0-9]+-[0-9]+', re.IGNORECASE)
+NUMBER_PATTERN = re.compile(r'[0-9]+')
+
+def parse_season_episode(file_path):
+    """Return (season, episode) for a path, or None when neither the name nor the folders say."""
+    SE_match = SEASON_EPISODE_PATTERN.search(os.path.basename(file_path))
+    if SE_match:
+        SE_nums = NUMBER_PATTERN.findall(SE_match.group(0))
+        return int(SE_nums[0]), int(SE_nums[1])
+
+    # Fall back to a <season>/<episode>.ext layout
+    path = Path(file_path)
+    if path.parent.name.isdigit() and path.stem.isdigit():
+        return int(path.parent.name), int(path.stem)
+
+    return None
+
+def extract_season_episode(file_path):
+    return parse_season_episode(file_path) or (1, 1)
+
+def scan_media_files(root, directories=None):
+    """Yield (path, extension) for every file under `root` in a stable order, using os.scandir.
+
+    Every directory visited is appended to `directories` when a list is given.
+    """
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        if directories is not None:
+            directories.append(directory)
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        subdirectories = []
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue  # Hidden files, including macOS "._" resource forks next to real media
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file():
+                yield entry.path, os.path.splitext(entry.name)[1].lower()
+        pending.extend(reversed(subdirectories))
+
+# Discovery results by input folder, reused while no directory under it has changed mtime
+# (adding, removing or renaming a file touches its parent directory). Source edits in place
+# don't change the listing and are caught by the fingerprints instead.
+discovery_cache = {}
+discovery_cache_lock = threading.Lock()
+
+def directory_signature(directories):
+    signature = []
+    for directory in directories:
+        try:
+            signature.append(os.stat(directory).st_mtime_ns)
+        except OSError:
+            signature.append(None)
+    return signature
+
+def list_content_files(use_cache=False):
+    """Discover the media under input_path and index it by (season, episode).
+
+    Every path is parsed exactly once. The result keeps the "videos"/"subtitles" lists, where
+    "videos" holds one video per episode in (season, episode) order, plus:
+      "keys":       path -> (season, episode) for every discovered file
+      "episodes":   (season, episode) -> {"video": path, "subtitles": [paths]}
+      "collisions": (season, episode) -> extra videos that parsed to an already-used episode
+      "unparsed":   files whose name gave no season/episode; they are ignored unless nothing in
+                    the folder parsed (a single film, say), in which case they are filed under (1, 1)
+    With `use_cache`, an earlier result for the same folder is returned if it is still current.
+    """
+    root = os.path.abspath(input_path)
+    if use_cache:
+        with discovery_cache_lock:
+            cached = discovery_cache.get(root)
+        if cached and directory_signature(cached["directories"]) == cached["signature"]:
+            return cached["content_files"]
+
+    content_files = {"videos": [], "subtitles": [], "keys": {}, "episodes": {}, "collisions": {}, "unparsed": []}
+    directories = []
+
+    for path, extension in scan_media_files(input_path, directories):
+        if extension in VIDEO_EXTENSIONS:
+            kind = "video"
+        elif extension in SUBTITLE_EXTENSIONS:
+            kind = "subtitles"
+            content_files["subtitles"].append(path)
+        else:
+            continue
+
+        key = parse_season_episode(path)
+        if key is None:
+            content_files["unparsed"].append(path)
+            continue
+        file_episode(content_files, key, path, kind)
+
+    if not content_files["episodes"]:
+        for path in content_files["unparsed"]:
+            file_episode(content_files, (1, 1), path, "subtitles" if path in content_files["subtitles"] else "video")
+
+    content_files["videos"] = [
+        episode["video"] for key, episode in sorted(content_files["episodes"].items()) if episode["video"]
+    ]
+    with discovery_cache_lock:
+        discovery_cache[root] = {"directories": directories, "signature": directory_signature(directories), "content_files": content_files}
+    return content_files
+
+def file_episode(content_files, key, path, kind):
+    content_files["keys"][path] = key
+    episode = content_files["episodes"].setdefault(key, {"video": None, "subtitles": []})
+    if kind == "subtitles":
+        episode["subtitles"].append(path)
+    elif episode["video"] is None:
+        episode["video"] = path
+    else:
+        content_files["collisions"].setdefault(key, []).append(path)
+
+def episode_key(content_files, file_path):
+    return content_files.get("keys", {}).get(file_path) or extract_season_episode(file_path)
+
+def log_discovery_report(content_files):
+    for (season_num, episode_num), extra_videos in sorted(content_files["collisions"].items()):
+        kept = content_files["episodes"][(season_num, episode_num)]["video"]
+        logging.warning(f"Season {season_num}, Episode {episode_num}: using {kept}, ignoring {', '.join(extra_videos)}")
+    for path in content_files["unparsed"]:
+        if path in content_files["keys"]:
+            logging.warning(f"Could not find a season/episode number in {path}; treating it as Season 1, Episode 1")
+        else:
+            logging.warning(f"Could not find a season/episode number in {path}; ignoring it")
+
+def ensure_dir_exists(directory):
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+# ==================
+# JOB STATUS
+# ==================
+
+class JobStatusStore:
+    """Per-job episode statuses in SQLite (WAL mode by default), exported to processing_status.json.
+
+    Every status change is one small transaction, so reads and writes cost the same however
+    many episodes the job has, a crash never leaves a half-written file, and any number of
+    threads or processes can update it. The JSON export keeps the shape main.js polls:
+    {"total_episodes", "processed_episodes", "percent_complete", "episodes": {"Season N": {"Episode M": status}}}
+    plus "total_media_seconds", "processed_media_seconds" and "eta_seconds". Once episode
+    durations are known (see MEDIA PROBES) percent_complete and the ETA are measured in media
+    seconds rather than episodes. The export is rewritten at most every `export_interval` seconds unless forced. Use a rollback
+    `journal_mode` such as "DELETE" when the folder is on a network filesystem.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS episodes (
+            season INTEGER NOT NULL,
+            episode INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (season, episode)
+        );
+        CREATE TABLE IF NOT EXISTS job (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS episode_outputs (
+            season INTEGER NOT NULL,
+            episode INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            output_key TEXT NOT NULL,
+            PRIMARY KEY (season, episode, stage)
+        );
+        CREATE TABLE IF NOT EXISTS episode_media (
+            season INTEGER NOT NULL,
+            episode INTEGER NOT NULL,
+            media_seconds REAL NOT NULL,
+            PRIMARY KEY (season, episode)
+        );
+        CREATE TABLE IF NOT EXISTS source_fingerprints (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            digest TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, frames_base_dir, export_interval=2.0, journal_mode="WAL"):
+        self.db_path = os.path.join(frames_base_dir, 'processing_status.db')
+        self.journal_mode = journal_mode
+        self.json_path = os.path.join(frames_base_dir, 'processing_status.json')
+        self.export_interval = export_interval
+        self.local = threading.local()
+        self.export_lock = threading.Lock()
+        self.last_export = 0.0
+        is_new = not os.path.exists(self.db_path)
+        self.connection().executescript(self.SCHEMA)
+        self.inode = os.stat(self.db_path).st_ino
+        if is_new and os.path.exists(self.json_path):
+            self.import_legacy_json()
+
+    def connection(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            db.execute(f'PRAGMA journal_mode={self.journal_mode}')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    @contextmanager
+    def transaction(self):
+        db = self.connection()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def import_legacy_json(self):
+        # Older runs wrote two schemas into the same file: a nested "episodes" map from
+        # initialize_job_status() and flat "Season N" keys from update_processing_status().
+        # The flat keys were the per-episode outcome, so they win.
+        with open(self.json_path, 'r') as file:
+            try:
+                legacy = json.load(file)
+            except json.JSONDecodeError:
+                return
+        statuses = {}
+        for seasons in (legacy.get("episodes", {}), legacy):
+            for season_key, episodes in seasons.items():
+                if not (season_key.startswith("Season ") and isinstance(episodes, dict)):
+                    continue
+                for episode_key, status in episodes.items():
+                    statuses[(int(season_key[7:]), int(episode_key[8:]))] = status
+        with self.transaction() as db:
+            db.executemany(
+                'INSERT OR REPLACE INTO episodes (season, episode, status, updated_at) VALUES (?, ?, ?, ?)',
+                [(season, episode, status, time.time()) for (season, episode), status in statuses.items()]
+            )
+
+    def initialize(self, episodes, media_seconds=None):
+        """Register the job's (season, episode) pairs, keeping the status of ones already known.
+
+        `media_seconds` maps episodes to their durations, which weight the progress and ETA.
+        """
+        episodes = set(episodes)
+        now = time.time()
+        with self.transaction() as db:
+            db.executemany(
+                "INSERT OR IGNORE INTO episodes (season, episode, status, updated_at) VALUES (?, ?, 'pending', ?)",
+                [(season, episode, now) for season, episode in episodes]
+            )
+            db.executemany(
+                'INSERT OR REPLACE INTO episode_media (season, episode, media_seconds) VALUES (?, ?, ?)',
+                [(season, episode, seconds) for (season, episode), seconds in (media_seconds or {}).items()]
+            )
+            db.execute("INSERT OR REPLACE INTO job (key, value) VALUES ('total_episodes', ?)", (str(len(episodes)),))
+            db.execute("INSERT OR REPLACE INTO job (key, value) VALUES ('started_at', ?)", (str(now),))
+        self.export_json(force=True)
+
+    def set_status(self, season_num, episode_num, status):
+        with self.transaction() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO episodes (season, episode, status, updated_at) VALUES (?, ?, ?, ?)',
+                (season_num, episode_num, status, time.time())
+            )
+        self.export_json()
+
+    def get_status(self, season_num, episode_num):
+        row = self.connection().execute(
+            'SELECT status FROM episodes WHERE season = ? AND episode = ?', (season_num, episode_num)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_output_key(self, season_num, episode_num, stage):
+        row = self.connection().execute(
+            'SELECT output_key FROM episode_outputs WHERE season = ? AND episode = ? AND stage = ?',
+            (season_num, episode_num, stage)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_output_key(self, season_num, episode_num, stage, output_key):
+        with self.transaction() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO episode_outputs (season, episode, stage, output_key) VALUES (?, ?, ?, ?)',
+                (season_num, episode_num, stage, output_key)
+            )
+
+    def clear_output_key(self, season_num, episode_num, stage):
+        with self.transaction() as db:
+            db.execute(
+                'DELETE FROM episode_outputs WHERE season = ? AND episode = ? AND stage = ?',
+                (season_num, episode_num, stage)
+            )
+
+    def cached_fingerprint(self, path, size, mtime_ns):
+        row = self.connection().execute(
+            'SELECT digest FROM source_fingerprints WHERE path = ? AND size = ? AND mtime_ns = ?', (path, size, mtime_ns)
+        ).fetchone()
+        return row[0] if row else None
+
+    def cache_fingerprint(self, path, size, mtime_ns, digest):
+        with self.transaction() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO source_fingerprints (path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)',
+                (path, size, mtime_ns, digest)
+            )
+
+    def snapshot(self):
+        db = self.connection()
+        rows = db.execute('SELECT season, episode, status, updated_at FROM episodes ORDER BY season, episode').fetchall()
+        job = dict(db.execute("SELECT key, value FROM job WHERE key IN ('total_episodes', 'started_at')").fetchall())
+        media = {(season, episode): seconds for season, episode, seconds in db.execute('SELECT season, episode, media_seconds FROM episode_media')}
+        total_episodes = int(job['total_episodes']) if 'total_episodes' in job else len(rows)
+        started_at = float(job.get('started_at', 0))
+        episodes = {}
+        for season, episode, status, _ in rows:
+            episodes.setdefault(f"Season {season}", {})[f"Episode {episode}"] = status
+        processed_episodes = min(total_episodes, sum(status == "completed" for _, _, status, _ in rows))
+        percent_complete = (processed_episodes / total_episodes) * 100 if total_episodes > 0 else 0
+
+        total_media = sum(media.values())
+        done_media = sum(media.get((season, episode), 0) for season, episode, status, _ in rows if status == "completed")
+        # The rate only counts episodes encoded by this run, not ones skipped as already done
+        encoded_media = sum(media.get((season, episode), 0) for season, episode, status, updated_at in rows
+                            if status == "completed" and updated_at >= started_at)
+        elapsed = time.time() - started_at
+        eta_seconds = None
+        if total_media > 0:
+            percent_complete = min(100.0, done_media / total_media * 100)
+            if encoded_media > 0 and elapsed > 0:
+                eta_seconds = round(max(0.0, total_media - done_media) / (encoded_media / elapsed), 1)
+        return {
+            "total_episodes": total_episodes,
+            "processed_episodes": processed_episodes,
+            "percent_complete": percent_complete,
+            "total_media_seconds": round(total_media, 3),
+            "processed_media_seconds": round(done_media, 3),
+            "eta_seconds": eta_seconds,
+            "episodes": episodes
+        }
+
+    def export_json(self, force=False):
+        with self.export_lock:
+            if not force and time.monotonic() - self.last_export < self.export_interval:
+                return
+            self.last_export = time.monotonic()
+            temp_path = f"{self.json_path}.{os.getpid()}.tmp"  # Other processes may be exporting too
+            with open(temp_path, 'w') as file:
+                json.dump(self.snapshot(), file, indent=4)
+            os.replace(temp_path, self.json_path)
+
+status_stores = {}
+status_stores_lock = threading.Lock()
+status_journal_mode = "WAL"
+
+def set_status_journal_mode(journal_mode):
+    global status_journal_mode
+    status_journal_mode = journal_mode
+
+def database_is_current(store):
+    """False once a cached store's database file was deleted or replaced, e.g. with its output folder."""
+    try:
+        return os.stat(store.db_path).st_ino == store.inode
+    except OSError:
+        return False
+
+def get_status_store(frames_base_dir):
+    with status_stores_lock:
+        store = status_stores.get(frames_base_dir)
+        if store is None or not database_is_current(store):
+            # A new store also means new per-thread connections; the old ones go with the old store
+            store = status_stores[frames_base_dir] = JobStatusStore(frames_base_dir, journal_mode=status_journal_mode)
+        return store
+
+def forget_cached_stores():
+    """Drop the cached status stores and media caches (and with them every thread's connections)."""
+    with status_stores_lock:
+        status_stores.clear()
+    with media_caches_lock:
+        media_caches.clear()
+
+# Initialize job status with all episodes
+def initialize_job_status(content_files, frames_base_dir, probes=None):
+    store = get_status_store(frames_base_dir)
+    media_seconds = {
+        episode_key(content_files, video_file): probe["duration"]
+        for video_file, probe in (probes or {}).items() if probe.get("duration")
+    }
+    store.initialize((episode_key(content_files, video_file) for video_file in content_files["videos"]), media_seconds)
+    return store
+
+# ==================
+# ENCODING PROFILES
+# ==================
+#
+# A profile sets the x264 preset/CRF (plus optional tune and extra args) for the two encodes:
+# "video" (the 1280x720 segments) and "subtitles" (the 500x500 per-line clips). Profiles can be
+# added or overridden under `encoding_profiles:` in ~/.memesrc/config.yml, e.g.
+#
+#   default_encoding_profile: fast-import
+#   encoding_profiles:
+#     fast-import:
+#       video: {preset: superfast}
+#
+# "balanced" leaves the preset unset (x264's medium) and is the output this pipeline always made.
+
+ENCODING_PROFILES = {
+    "fast-import": {"video": {"preset": "veryfast", "crf": 31}, "subtitles": {"preset": "veryfast", "crf": 35}},
+    "balanced": {"video": {"crf": 31}, "subtitles": {"crf": 35}},
+    "archival": {"video": {"preset": "slow", "crf": 28}, "subtitles": {"preset": "slow", "crf": 32}},
+}
+
+def load_encoding_profiles():
+    profiles = {name: {stage: dict(settings) for stage, settings in profile.items()} for name, profile in ENCODING_PROFILES.items()}
+    for name, profile in (cfg.get('encoding_profiles') or {}).items():
+        merged = profiles.setdefault(name, {"video": {"crf": 31}, "subtitles": {"crf": 35}})
+        for stage in ("video", "subtitles"):
+            merged[stage].update((profile or {}).get(stage) or {})
+    return profiles
+
+def x264_args(settings):
+    codec_args = ["-c:v", "libx264", "-profile:v", "baseline", "-level", "3.0", "-pix_fmt", "yuv420p"]
+    if settings.get("preset"):
+        codec_args += ["-preset", str(settings["preset"])]
+    if settings.get("tune"):
+        codec_args += ["-tune", str(settings["tune"])]
+    codec_args += ["-crf", str(settings["crf"])]
+    return codec_args + [str(arg) for arg in settings.get("extra_args", [])]
+
+def set_encoding_profile(name=None):
+    """Select the profile used by every encode from here on; returns its name."""
+    global VIDEO_CLIP_CODEC_ARGS, SUBTITLE_CLIP_CODEC_ARGS
+    profiles = load_encoding_profiles()
+    name = name or cfg.get('default_encoding_profile') or "balanced"
+    if name not in profiles:
+        raise ValueError(f"Unknown encoding profile '{name}'. Available: {', '.join(sorted(profiles))}")
+    VIDEO_CLIP_CODEC_ARGS = x264_args(profiles[name]["video"])
+    SUBTITLE_CLIP_CODEC_ARGS = x264_args(profiles[name]["subtitles"]) + ["-an"]
+    return name
+
+# Video segments are scaled to fit in 1280x720; subtitle clips (below) to fit in 500x500
+VIDEO_CLIP_FILTER = "scale='min(iw,1280)':min'(ih,720)':force_original_aspect_ratio=decrease"
+
+# ==================
+# CHECKPOINTS
+# ==================
+#
+# Every clip is written under a temporary name and only renamed to its final name once ffmpeg
+# has finished it, so an N.mp4 or s{N}.mp4 on disk is always a complete file. Segments are
+# written as _seg{N}.mp4 and listed in _segments.csv by ffmpeg's segment muxer as each one is
+# closed; subtitle clips are written as s{N}.part.mp4 and renamed when their invocation succeeds.
+# After a crash or cancel, finished clips that still look like whole mp4 files are kept and
+# only the missing ones are encoded again.
+
+SEGMENT_LIST_NAME = "_segments.csv"
+
+def partial_clip_path(path):
+    return path[:-len(".mp4")] + ".part.mp4"
+
+def mp4_is_complete(path):
+    """Cheap structural check that `path` is a whole mp4: an ftyp box first, top-level boxes that
+    add up to the file size, and both moov and mdat present. A file cut short fails it."""
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as file:
+            seen, offset = [], 0
+            while offset < size:
+                file.seek(offset)
+                header = file.read(16)
+                if len(header) < 8:
+                    return False
+                box_size, box_type = struct.unpack(">I4s", header[:8])
+                if box_size == 1 and len(header) == 16:
+                    box_size = struct.unpack(">Q", header[8:16])[0]
+                elif box_size == 0:
+                    box_size = size - offset
+                if box_size < 8 or offset + box_size > size:
+                    return False
+                seen.append(box_type)
+                offset += box_size
+    except OSError:
+        return False
+    return bool(seen) and seen[0] == b"ftyp" and b"moov" in seen and b"mdat" in seen
+
+def finish_clips(episode_dir, clip_numbers, check_complete=False):
+    """Rename the finished s{N}.part.mp4 outputs to s{N}.mp4; True when every clip now exists.
+
+    After a failed ffmpeg run, `check_complete` promotes only outputs that are whole mp4 files.
+    """
+    is_finished = mp4_is_complete if check_complete else clip_is_written
+    for clip_number in clip_numbers:
+        path = subtitle_clip_path(episode_dir, clip_number)
+        if is_finished(partial_clip_path(path)):
+            os.replace(partial_clip_path(path), path)
+    return all(clip_is_written(subtitle_clip_path(episode_dir, n)) for n in clip_numbers)
+
+def unfinished_clips(episode_dir, clips):
+    """The (clip_number, start, end) clips whose s{N}.mp4 doesn't exist yet."""
+    return [clip for clip in clips if not clip_is_written(subtitle_clip_path(episode_dir, clip[0]))]
+
+def keep_completed_subtitle_clips(episode_dir):
+    """Return the clip numbers whose s{N}.mp4 is complete, deleting any that are not."""
+    done = set()
+    for number, filename in list_subtitle_clips(episode_dir):
+        if mp4_is_complete(os.path.join(episode_dir, filename)):
+            done.add(number)
+        else:
+            os.remove(os.path.join(episode_dir, filename))
+    return done
+
+def settle_video_segments(clips_dir):
+    """Promote the segments ffmpeg finished to N.mp4, drop the rest and return how many leading
+    segments (0.mp4, 1.mp4, ...) are complete."""
+    list_path = os.path.join(clips_dir, SEGMENT_LIST_NAME)
+    if os.path.exists(list_path):
+        with open(list_path, 'r', newline='') as segment_list:
+            for row in csv.reader(segment_list):
+                match = re.fullmatch(r"_seg([0-9]+)\.mp4", os.path.basename(row[0])) if row else None
+                if match and os.path.exists(os.path.join(clips_dir, match.group(0))):
+                    os.replace(os.path.join(clips_dir, match.group(0)), os.path.join(clips_dir, f"{match.group(1)}.mp4"))
+        os.remove(list_path)
+    clear_outputs(clips_dir, r"_seg[0-9]+\.mp4")
+
+    completed = 0
+    while mp4_is_complete(os.path.join(clips_dir, f"{completed}.mp4")):
+        completed += 1
+    # Anything after the first gap is re-encoded from the gap onwards
+    for filename in os.listdir(clips_dir):
+        match = re.fullmatch(r"([0-9]+)\.mp4", filename)
+        if match and int(match.group(1)) >= completed:
+            os.remove(os.path.join(clips_dir, filename))
+    return completed
+
+def extract_video_clips(episode_file, clips_dir, fps=30, clip_duration=25, threads=None, on_progress=None, resume=False):
+    """Cut the episode into numbered clip_duration-second segments (0.mp4, 1.mp4, ...).
+
+    With `resume`, segments finished by an earlier, interrupted run are kept and encoding
+    restarts at the first missing one (seeking to its start time).
+    """
+    threads = threads or encode_plan["video_threads"]
+    first_segment = settle_video_segments(clips_dir) if resume else 0
+    if first_segment:
+        logging.info(f"Resuming {episode_file} at segment {first_segment}.")
+    output_pattern = os.path.join(clips_dir, "_seg%d.mp4")
+    seek = ["-ss", str(first_segment * clip_duration)] if first_segment else []
+
+    command = [
+        FFMPEG_PATH, "-y", *seek, "-i", episode_file,
+        "-vf", f"fps={fps},{VIDEO_CLIP_FILTER}",
+        *VIDEO_CLIP_CODEC_ARGS,
+        "-force_key_frames", f"expr:gte(t,n_forced*{clip_duration})",
+        "-segment_time", str(clip_duration), "-f", "segment",
+        "-segment_start_number", str(first_segment),
+        "-segment_list", os.path.join(clips_dir, SEGMENT_LIST_NAME), "-segment_list_type", "csv",
+        "-reset_timestamps", "1",
+        "-an",
+        "-threads", str(threads),
+        output_pattern
+    ]
+
+    result = run_ffmpeg(command, threads, on_progress)
+    if result.returncode != 0:
+        raise ClipExtractionError(f"ffmpeg exited with {result.returncode} while segmenting {episode_file}: {result.errors[-500:]}")
+    # Every segment is finished once ffmpeg exits cleanly, listed or not
+    for filename in os.listdir(clips_dir):
+        match = re.fullmatch(r"_seg([0-9]+)\.mp4", filename)
+        if match:
+            os.replace(os.path.join(clips_dir, filename), os.path.join(clips_dir, f"{match.group(1)}.mp4"))
+    list_path = os.path.join(clips_dir, SEGMENT_LIST_NAME)
+    if os.path.exists(list_path):
+        os.remove(list_path)
+
+# Subtitle clips are padded on both sides and scaled to fit in 500x500
+SUBTITLE_CLIP_BUFFER = 0.1  # 100 milliseconds
+SUBTITLE_CLIP_FILTER = "scale='min(iw*min(500/iw,500/ih),500)':'min(ih*min(500/iw,500/ih),500)':force_original_aspect_ratio=decrease,pad=ceil(iw/2)*2:ceil(ih/2)*2"
+
+set_encoding_profile("balanced")
+
+def subtitle_clip_window(subtitle):
+    # Add a buffer before the start and after the end, without going below zero
+    start_time_with_buffer = max(0, subtitle.start.total_seconds() - SUBTITLE_CLIP_BUFFER)
+    end_time_with_buffer = subtitle.end.total_seconds() + SUBTITLE_CLIP_BUFFER
+    return start_time_with_buffer, end_time_with_buffer
+
+def plan_subtitle_batches(subtitles, max_window_seconds=300, max_clips=32):
+    """Group subtitle clips into contiguous time windows that can each be decoded once.
+
+    Returns a list of batches; each batch is a list of (clip_number, start, end) tuples in
+    seconds. A window is closed once it would span more than `max_window_seconds` of source
+    or hold more than `max_clips` outputs, which keeps the per-invocation encoder count bounded.
+    """
+    clips = sorted(
+        ((index + 1,) + subtitle_clip_window(subtitle) for index, subtitle in enumerate(subtitles)),
+        key=lambda clip: clip[1]
+    )
+    batches = []
+    current = []
+    window_start = 0
+    for clip in clips:
+        if current and (clip[2] - window_start > max_window_seconds or len(current) >= max_clips):
+            batches.append(current)
+            current = []
+        if not current:
+            window_start = clip[1]
+        current.append(clip)
+    if current:
+        batches.append(current)
+    return batches
+
+def subtitle_clip_path(episode_dir, clip_number):
+    return os.path.join(episode_dir, f"s{clip_number}.mp4")
+
+def subtitle_clip_command(episode_file, episode_dir, clip_number, start, end, fps, threads=1):
+    output_file = partial_clip_path(subtitle_clip_path(episode_dir, clip_number))  # Naming starts from s1.mp4
+    return [
+        FFMPEG_PATH, "-y", "-ss", str(start), "-i", episode_file,
+        "-t", str(end - start),  # Use the duration of the clip with buffer
+        "-vf", f"fps={fps},{SUBTITLE_CLIP_FILTER}",
+        *SUBTITLE_CLIP_CODEC_ARGS,
+        "-threads", str(threads),
+        output_file
+    ]
+
+def subtitle_batch_command(episode_file, episode_dir, batch, fps, threads=1):
+    """Build one ffmpeg invocation that decodes a window once and writes every clip in it.
+
+    The window is scaled once and split into one branch per clip. Each branch is trimmed to
+    the clip's range (relative to the window start) and only then resampled to `fps`, so the
+    frames picked match a standalone `-ss start -t duration -vf fps=...` encode.
+    """
+    window_start = batch[0][1]
+    window_end = max(end for _, _, end in batch)
+    branches = "".join(f"[b{i}]" for i in range(len(batch)))
+    filters = [f"[0:v]{SUBTITLE_CLIP_FILTER},split={len(batch)}{branches}"]
+    outputs = []
+    for i, (clip_number, start, end) in enumerate(batch):
+        filters.append(
+            f"[b{i}]trim=start={start - window_start:.3f}:end={end - window_start:.3f},"
+            f"setpts=PTS-STARTPTS,fps={fps}[o{i}]"
+        )
+        outputs += ["-map", f"[o{i}]", *SUBTITLE_CLIP_CODEC_ARGS, "-threads", str(threads), partial_clip_path(subtitle_clip_path(episode_dir, clip_number))]
+    return [
+        FFMPEG_PATH, "-y", "-ss", f"{window_start:.3f}", "-t", f"{window_end - window_start:.3f}", "-i", episode_file,
+        "-filter_complex", ";".join(filters),
+        *outputs
+    ]
+
+def clip_windows_seconds(clips):
+    """Total length of the (clip_number, start, end) windows a batch or span writes."""
+    return sum(end - start for _, start, end in clips)
+
+def clip_is_written(path):
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+def run_subtitle_jobs(episode_file, episode_dir, batches, fps, retries=2, log=logging):
+    """Encode subtitle batches concurrently within the episode's share of the CPU budget.
+
+    Each batch becomes one ffmpeg invocation (a single clip uses the plain per-clip command).
+    A batch counts as done only when ffmpeg exits cleanly and every clip it owns is non-empty;
+    otherwise the clips that did come out whole are kept and the rest are retried, up to
+    `retries` times. Returns the batches that never succeeded.
+    """
+    threads = encode_plan["subtitle_threads"]
+
+    def attempt(batch):
+        for attempt_number in range(retries + 1):
+            if len(batch) == 1:
+                command = subtitle_clip_command(episode_file, episode_dir, *batch[0], fps, threads)
+            else:
+                command = subtitle_batch_command(episode_file, episode_dir, batch, fps, threads)
+            clip_numbers = [clip_number for clip_number, _, _ in batch]
+            result = run_ffmpeg(command, threads, media_seconds=clip_windows_seconds(batch))
+            if finish_clips(episode_dir, clip_numbers, check_complete=result.returncode != 0) and result.returncode == 0:
+                return True
+            log.warning(f"Subtitle clips {clip_numbers[0]}-{clip_numbers[-1]} failed "
+                        f"(attempt {attempt_number + 1}, exit code {result.returncode}): {result.errors[-500:]}")
+            batch = unfinished_clips(episode_dir, batch)
+            if not batch:
+                return True
+        return False
+
+    with ThreadPoolExecutor(max_workers=encode_plan["subtitle_jobs"]) as executor:
+        # Run each job in a copy of this context so its ffmpeg usage counts toward the current stage
+        futures = [executor.submit(contextvars.copy_context().run, attempt, batch) for batch in batches]
+        results = [future.result() for future in futures]
+    return [batch for batch, succeeded in zip(batches, results) if not succeeded]
+
+def plan_subtitle_spans(subtitles, max_gap=0.5, max_span_seconds=120, max_clips=64):
+    """Merge overlapping or nearly adjacent subtitle windows into spans that are encoded once.
+
+    Windows are joined while the next one starts no more than `max_gap` seconds after the
+    current span ends, up to `max_span_seconds` of source or `max_clips` clips per span.
+    Returns a list of spans, each a list of (clip_number, start, end) tuples sorted by start.
+    """
+    clips = sorted(
+        ((index + 1,) + subtitle_clip_window(subtitle) for index, subtitle in enumerate(subtitles)),
+        key=lambda clip: clip[1]
+    )
+    spans = []
+    current = []
+    span_start = span_end = 0
+    for clip in clips:
+        if current and (clip[1] > span_end + max_gap or max(span_end, clip[2]) - span_start > max_span_seconds or len(current) >= max_clips):
+            spans.append(current)
+            current = []
+        if not current:
+            span_start, span_end = clip[1], clip[2]
+        current.append(clip)
+        span_end = max(span_end, clip[2])
+    if current:
+        spans.append(current)
+    return spans
+
+def subtitle_span_path(episode_dir, span):
+    return os.path.join(episode_dir, f"_span{span[0][0]}.mp4")
+
+def subtitle_span_commands(episode_file, episode_dir, span, fps, threads=1):
+    """Build the two ffmpeg invocations for a coalesced span.
+
+    The first encodes the whole span once, forcing a keyframe at every clip start. The second
+    stream-copies each clip out of it (no decoding), so every s{N}.mp4 starts on its keyframe.
+    Clip frames follow the span's frame grid, which can differ from a standalone encode by up
+    to one frame.
+    """
+    span_start = span[0][1]
+    span_end = max(end for _, _, end in span)
+    span_path = subtitle_span_path(episode_dir, span)
+    keyframes = ",".join(f"{start - span_start:.3f}" for _, start, _ in span)
+    encode = [
+        FFMPEG_PATH, "-y", "-ss", f"{span_start:.3f}", "-t", f"{span_end - span_start:.3f}", "-i", episode_file,
+        "-vf", f"fps={fps},{SUBTITLE_CLIP_FILTER}",
+        *SUBTITLE_CLIP_CODEC_ARGS,
+        "-force_key_frames", keyframes,
+        "-threads", str(threads),
+        span_path
+    ]
+    outputs = []
+    for clip_number, start, end in span:
+        outputs += ["-map", "0:v", "-ss", f"{start - span_start:.3f}", "-t", f"{end - start:.3f}",
+                    "-c", "copy", "-avoid_negative_ts", "make_zero", partial_clip_path(subtitle_clip_path(episode_dir, clip_number))]
+    copy = [FFMPEG_PATH, "-y", "-i", span_path, *outputs]
+    return encode, copy
+
+def run_subtitle_spans(episode_file, episode_dir, spans, fps, retries=2, log=logging):
+    """Encode coalesced spans concurrently and cut their clips out; returns the spans that failed.
+
+    A span counts as done when both invocations exit cleanly and every clip it owns is non-empty;
+    otherwise the clips that did come out whole are kept and a span of the rest is retried.
+    The intermediate span files are removed either way.
+    """
+    threads = encode_plan["subtitle_threads"]
+
+    def attempt(span):
+        span_paths = set()
+        try:
+            for attempt_number in range(retries + 1):
+                encode, copy = subtitle_span_commands(episode_file, episode_dir, span, fps, threads)
+                clip_numbers = [clip_number for clip_number, _, _ in span]
+                span_paths.add(subtitle_span_path(episode_dir, span))
+                # The span encode is an intermediate; the stage is credited with the clips cut from it
+                result = run_ffmpeg(encode, threads, media_seconds=0)
+                if result.returncode == 0:
+                    result = run_ffmpeg(copy, 1, media_seconds=clip_windows_seconds(span))
+                if finish_clips(episode_dir, clip_numbers, check_complete=result.returncode != 0) and result.returncode == 0:
+                    return True
+                log.warning(f"Subtitle span s{clip_numbers[0]}-s{clip_numbers[-1]} failed "
+                            f"(attempt {attempt_number + 1}, exit code {result.returncode}): {result.errors[-500:]}")
+                span = unfinished_clips(episode_dir, span)
+                if not span:
+                    return True
+            return False
+        finally:
+            for span_path in span_paths:
+                if os.path.exists(span_path):
+                    os.remove(span_path)
+
+    with ThreadPoolExecutor(max_workers=encode_plan["subtitle_jobs"]) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, attempt, span) for span in spans]
+        results = [future.result() for future in futures]
+    return [span for span, succeeded in zip(spans, results) if not succeeded]
+
+def skip_done_clips(batches, done):
+    batches = [[clip for clip in batch if clip[0] not in done] for batch in batches]
+    return [batch for batch in batches if batch]
+
+def extract_subtitle_clips(episode_file, subtitles, episode_dir, fps, mode="batched", retries=2, log=logging, done=()):
+    """Write one s{N}.mp4 clip per subtitle line and return the clip numbers that failed.
+
+    In "batched" mode the source is decoded once per window of nearby subtitles (see
+    plan_subtitle_batches); "coalesced" encodes each run of overlapping or adjacent lines once
+    and stream-copies the clips out of it (see plan_subtitle_spans); "per-clip" starts a
+    separate ffmpeg process for every line. Clips from a batch or span that keeps failing are
+    retried one at a time before being reported. Clip numbers in `done` (finished by an earlier
+    run) are left out of the plan.
+    """
+    if mode == "coalesced":
+        spans = skip_done_clips(plan_subtitle_spans(subtitles), done)
+        encoded = sum(max(end for _, _, end in span) - span[0][1] for span in spans)
+        requested = sum(end - start for span in spans for _, start, end in span)
+        log.info(f"Coalesced {sum(len(span) for span in spans)} subtitle clips into {len(spans)} spans: "
+                 f"encoding {encoded:.1f}s of video instead of {requested:.1f}s.")
+        failed_batches = run_subtitle_spans(episode_file, episode_dir, spans, fps, retries, log)
+    else:
+        if mode == "per-clip":
+            batches = [[(index + 1,) + subtitle_clip_window(subtitle)] for index, subtitle in enumerate(subtitles)]
+        else:
+            batches = plan_subtitle_batches(subtitles)
+        batches = skip_done_clips(batches, done)
+        failed_batches = run_subtitle_jobs(episode_file, episode_dir, batches, fps, retries, log)
+    if mode != "per-clip" and failed_batches:
+        # Only the clips still missing; whole ones from the failed runs were kept
+        single_clips = [[clip] for batch in failed_batches for clip in unfinished_clips(episode_dir, batch)]
+        failed_batches = run_subtitle_jobs(episode_file, episode_dir, single_clips, fps, retries, log)
+    return sorted(clip_number for batch in failed_batches for clip_number, _, _ in batch)
+
+def list_subtitle_clips(clips_dir):
+    """Return (clip_number, filename) for the s{N}.mp4 files in a directory, in clip order."""
+    clips = []
+    for filename in os.listdir(clips_dir):
+        match = re.fullmatch(r"s([0-9]+)\.mp4", filename)
+        if match:
+            clips.append((int(match.group(1)), filename))
+    return sorted(clips)
+
+def zip_video_clips(clips_dir):
+    # Dictionary to hold lists of files for each zip
+    zip_groups = {}
+    for number, filename in list_subtitle_clips(clips_dir):
+        # Determine the group for this file
+        group_number = number // 15
+        if group_number not in zip_groups:
+            zip_groups[group_number] = []
+        zip_groups[group_number].append(filename)
+
+    # Create a zip file for each group
+    for group_number, filenames in zip_groups.items():
+        zip_filename = os.path.join(clips_dir, f"s{group_number}.zip")
+        with zipfile.ZipFile(zip_filename, 'w') as zipf:
+            for filename in filenames:
+                file_path = os.path.join(clips_dir, filename)
+                zipf.write(file_path, arcname=filename)
+                # After adding the file to zip, delete the original mp4 file
+                os.remove(file_path)  # This deletes the sX.mp4 file after it's zipped
+        print(f"Created zip file: {zip_filename}")
+
+# Packed clip store: every s{N}.mp4 of an episode back to back in _clips.pack, plus _clips.idx,
+# an 8-byte magic and a little-endian uint32 clip count followed by one (uint32 clip number,
+# uint64 offset, uint32 length) record per clip in clip-number order. Each byte range is a
+# complete mp4, so a single clip can be served with an HTTP range request or read via mmap.
+CLIP_PACK_NAME = "_clips.pack"
+CLIP_INDEX_NAME = "_clips.idx"
+CLIP_INDEX_MAGIC = b"MSRCIDX1"
+CLIP_INDEX_RECORD = struct.Struct("<IQI")
+
+def pack_video_clips(clips_dir):
+    clips = list_subtitle_clips(clips_dir)
+    if not clips:
+        return
+    pack_path = os.path.join(clips_dir, CLIP_PACK_NAME)
+    index_path = os.path.join(clips_dir, CLIP_INDEX_NAME)
+    records = []
+    with open(pack_path + '.tmp', 'wb') as pack:
+        for number, filename in clips:
+            offset = pack.tell()
+            with open(os.path.join(clips_dir, filename), 'rb') as clip:
+                shutil.copyfileobj(clip, pack, 1 << 20)
+            records.append(CLIP_INDEX_RECORD.pack(number, offset, pack.tell() - offset))
+    with open(index_path + '.tmp', 'wb') as index:
+        index.write(CLIP_INDEX_MAGIC + struct.pack("<I", len(records)) + b"".join(records))
+    os.replace(pack_path + '.tmp', pack_path)
+    os.replace(index_path + '.tmp', index_path)
+    for _, filename in clips:
+        os.remove(os.path.join(clips_dir, filename))
+    print(f"Created clip pack: {pack_path} ({len(clips)} clips)")
+
+def read_clip_index(clips_dir):
+    """Return {clip_number: (offset, length)} from an episode's _clips.idx."""
+    with open(os.path.join(clips_dir, CLIP_INDEX_NAME), 'rb') as index:
+        data = index.read()
+    if data[:len(CLIP_INDEX_MAGIC)] != CLIP_INDEX_MAGIC:
+        raise ValueError(f"{clips_dir} does not contain a valid {CLIP_INDEX_NAME}")
+    count, = struct.unpack_from("<I", data, len(CLIP_INDEX_MAGIC))
+    start = len(CLIP_INDEX_MAGIC) + 4
+    return {
+        number: (offset, length)
+        for number, offset, length in CLIP_INDEX_RECORD.iter_unpack(data[start:start + count * CLIP_INDEX_RECORD.size])
+    }
+
+def read_packed_clip(clips_dir, clip_number):
+    """Return the bytes of s{clip_number}.mp4 from an episode's clip pack."""
+    offset, length = read_clip_index(clips_dir)[clip_number]
+    with open(os.path.join(clips_dir, CLIP_PACK_NAME), 'rb') as pack:
+        with mmap.mmap(pack.fileno(), 0, access=mmap.ACCESS_READ) as packed:
+            return packed[offset:offset + length]
+
+def store_video_clips(clips_dir, clip_store="zip"):
+    if clip_store == "pack":
+        pack_video_clips(clips_dir)
+    else:
+        zip_video_clips(clips_dir)
+
+# ==================
+# SUBTITLE HANDLING
+# ==================
+
+#
+# An episode's subtitles come from a sidecar .srt when there is one, otherwise from the best text
+# subtitle track embedded in the video (by SUBTITLE_LANGUAGES), pulled out with one ffmpeg demux
+# pass that never decodes the video. Parsed cues are cached in the media cache, keyed by the
+# SRT's hash or the video's fingerprint and track, so re-runs skip extraction and parsing.
+
+SubtitleSource = namedtuple('SubtitleSource', ['kind', 'path', 'stream', 'language'])
+
+# Codecs ffmpeg can turn into SRT; image-based tracks (PGS, VobSub) would need OCR
+SUBTITLE_TEXT_CODECS = {"subrip", "srt", "ass", "ssa", "webvtt", "mov_text", "text"}
+SUBTITLE_EXTRACT_TIMEOUT_SECONDS = 600
+CUE_CACHE_VERSION = 1
+
+def decode_subtitle_bytes(data):
+    """Decode a subtitle file: a BOM wins, then strict UTF-8, then cp1252 (common in older rips)."""
+    if data.startswith(codecs.BOM_UTF8):
+        text = data[len(codecs.BOM_UTF8):].decode('utf-8', errors='replace')
+    elif data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        text = data.decode('utf-16', errors='replace')
+    else:
+        try:
+            text = data.decode('utf-8')
+        except UnicodeDecodeError:
+            text = data.decode('cp1252', errors='replace')
+    return unicodedata.normalize('NFC', text.replace('\r\n', '\n').replace('\r', '\n'))
+
+def parse_srt(srt_file):
+    with open(srt_file, 'rb') as f:
+        subtitles = list(srt.parse(decode_subtitle_bytes(f.read())))
+    return subtitles
+
+def choose_subtitle_stream(probe, languages=None):
+    """The embedded text subtitle track to use, or None.
+
+    Tracks in a preferred language come first (in preference order), then untagged ones, then
+    the rest; within those, full tracks beat "forced" ones and default tracks win ties.
+    """
+    languages = SUBTITLE_LANGUAGES if languages is None else languages
+    candidates = [stream for stream in probe.get("streams", [])
+                  if stream["type"] == "subtitle" and stream.get("codec") in SUBTITLE_TEXT_CODECS]
+    if not candidates:
+        return None
+
+    def rank(stream):
+        language = (stream.get("language") or "").lower()
+        language_rank = languages.index(language) if language in languages else len(languages) + (1 if language else 0)
+        forced = "forced" in (stream.get("title") or "").lower()
+        return (language_rank, forced, not stream.get("default"), stream["index"])
+
+    return min(candidates, key=rank)
+
+def find_subtitle_source(episode_file, content_files, season_num, episode_num):
+    subtitle_file = find_matching_subtitle(episode_file, content_files, season_num, episode_num)
+    if subtitle_file:
+        return SubtitleSource("file", subtitle_file, None, None)
+    stream = choose_subtitle_stream(content_files.get("probes", {}).get(episode_file) or {})
+    if stream:
+        return SubtitleSource("embedded", episode_file, stream["index"], stream.get("language"))
+    return None
+
+def describe_subtitle_source(source):
+    if source.kind == "file":
+        return source.path
+    return f"{source.path} (embedded stream {source.stream}{', ' + source.language if source.language else ''})"
+
+def subtitle_source_key(source, store=None):
+    """What a source's cues depend on: the SRT's hash, or the video fingerprint and track."""
+    if source.kind == "file":
+        return file_sha1(source.path)
+    return f"{source_fingerprint(source.path, store)}:{source.stream}"
+
+def extract_embedded_subtitles(episode_file, stream_index):
+    """Demux one subtitle track to SRT on stdout; only that stream is read and converted."""
+    if cancel_requested.is_set():
+        raise JobCancelled()
+    result = subprocess.run(
+        [FFMPEG_PATH, "-hide_banner", "-loglevel", "error", "-i", episode_file,
+         "-map", f"0:{stream_index}", "-c:s", "srt", "-f", "srt", "pipe:1"],
+        capture_output=True, timeout=SUBTITLE_EXTRACT_TIMEOUT_SECONDS
+    )
+    if result.returncode != 0:
+        errors = result.stderr.decode('utf-8', errors='replace').strip()
+        raise ClipExtractionError(f"Could not extract subtitle stream {stream_index} from {episode_file}: {errors[-500:]}")
+    return list(srt.parse(decode_subtitle_bytes(result.stdout)))
+
+def serialize_cues(subtitles):
+    return zlib.compress(json.dumps([
+        [subtitle.index, subtitle.start // timedelta(milliseconds=1), subtitle.end // timedelta(milliseconds=1), subtitle.content]
+        for subtitle in subtitles
+    ], ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+def deserialize_cues(data):
+    return [srt.Subtitle(index, timedelta(milliseconds=start), timedelta(milliseconds=end), content)
+            for index, start, end, content in json.loads(zlib.decompress(data))]
+
+def load_subtitles(source, source_key=None, store=None):
+    """Parsed cues for a SubtitleSource, from the media cache when the source hasn't changed."""
+    source_key = source_key or subtitle_source_key(source, store)
+    cache = get_media_cache()
+    subtitles = cache.get_cues(source_key)
+    if subtitles is None:
+        if source.kind == "file":
+            subtitles = parse_srt(source.path)
+        else:
+            subtitles = extract_embedded_subtitles(source.path, source.stream)
+        cache.put_cues(source_key, subtitles)
+    return subtitles
+
+def find_matching_subtitle(episode_file, content_files, season_num, episode_num):
+    """Look up the subtitle for an episode in the discovery index.
+
+    When several subtitle files share the episode, prefer the one named like the video.
+    """
+    episode = content_files["episodes"].get((season_num, episode_num))
+    if not episode or not episode["subtitles"]:
+        return None
+    video_stem = os.path.splitext(os.path.basename(episode_file))[0]
+    for subtitle_file in episode["subtitles"]:
+        if os.path.basename(subtitle_file).startswith(video_stem):
+            return subtitle_file
+    return episode["subtitles"][0]
+
+DOCS_FIELDNAMES = ['season', 'episode', 'subtitle_index', 'subtitle_text', 'start_frame', 'end_frame']
+DOCS_HEADER = (','.join(DOCS_FIELDNAMES) + '\r\n').encode('utf-8')  # csv.DictWriter's default line terminator
+DOCS_MANIFEST_NAME = '_docs_manifest.json'
+
+def numeric_sort_key(name):
+    # Season and episode directories are numbered; keep them in numeric order ahead of anything else
+    return (0, int(name), '') if name.isdigit() else (1, 0, name)
+
+def docs_row_key(row):
+    return (int(row['season']), int(row['episode']), int(row['subtitle_index']))
+
+def find_episode_csvs(directory):
+    """Yield the per-episode _docs.csv files under `directory` in numeric season/episode order.
+
+    Episode directories are the leaves of the tree, so a _docs.csv sitting next to
+    subdirectories is an aggregate written by an earlier run and is skipped.
+    """
+    for subdir, dirs, files in os.walk(directory):
+        # Walk in a fixed order so the output doesn't depend on filesystem listing order
+        dirs.sort(key=numeric_sort_key)
+        if not dirs and '_docs.csv' in files:
+            yield os.path.join(subdir, '_docs.csv')
+
+def merge_docs_rows(csv_paths):
+    """Lazily k-way merge already-sorted _docs.csv files on (season, episode, subtitle_index).
+
+    Each file is peeked once for its first key and then only opened when the merge reaches
+    that key, so the number of open files stays at the number of sources whose key ranges
+    overlap (one, for a normal library) rather than the number of episodes.
+    """
+    pending = []
+    for sequence, path in enumerate(csv_paths):
+        with open(path, 'r', newline='', encoding='utf-8') as csvfile:
+            first_row = next(csv.DictReader(csvfile), None)
+        if first_row is not None:
+            pending.append((docs_row_key(first_row), sequence, path))
+    pending.sort(reverse=True)
+
+    heap = []
+    try:
+        while heap or pending:
+            # Open every source that could supply the next row in key order
+            while pending and (not heap or pending[-1][0] <= heap[0][0]):
+                _, sequence, path = pending.pop()
+                csvfile = open(path, 'r', newline='', encoding='utf-8')
+                reader = csv.DictReader(csvfile)
+                row = next(reader, None)
+                if row is None:
+                    csvfile.close()
+                    continue
+                heapq.heappush(heap, (docs_row_key(row), sequence, row, reader, csvfile))
+            key, sequence, row, reader, csvfile = heapq.heappop(heap)
+            yield row
+            next_row = next(reader, None)
+            if next_row is None:
+                csvfile.close()
+            else:
+                heapq.heappush(heap, (docs_row_key(next_row), sequence, next_row, reader, csvfile))
+    finally:
+        for entry in heap:
+            entry[4].close()
+
+def aggregate_csv_data(directory):
+    """Stream the rows of every episode _docs.csv under `directory` in sorted order, without duplicates."""
+    last_key = None
+    for row in merge_docs_rows(find_episode_csvs(directory)):
+        # Duplicates are adjacent after the merge, so comparing with the previous key is enough
+        key = docs_row_key(row)
+        if key != last_key:
+            last_key = key
+            yield row
+
+def write_aggregated_csv(data, path):
+    """Write rows through a buffered temp file and move it into place; nothing is written for no rows."""
+    temp_path = path + '.tmp'
+    wrote_rows = False
+    with open(temp_path, 'w', newline='', encoding='utf-8', buffering=1 << 20) as csvfile:
+        csv_writer = csv.DictWriter(csvfile, fieldnames=DOCS_FIELDNAMES, extrasaction='ignore')
+        for row in data:
+            if not wrote_rows:
+                csv_writer.writeheader()
+                wrote_rows = True
+            csv_writer.writerow(row)
+    if wrote_rows:
+        os.replace(temp_path, path)
+    else:
+        os.remove(temp_path)
+
+# ======================
+# INCREMENTAL AGGREGATION
+# ======================
+#
+# Aggregated _docs.csv files are the header followed by the bodies (everything after the header
+# line) of their parts, in numeric order: episode files make up a season file, season files make
+# up the top-level file. The manifest remembers each part's fingerprint and body length, which
+# gives the byte offset of every part. When a part changes, the aggregate is truncated at that
+# part's offset and only the parts from there on are re-appended, so adding an episode at the end
+# of a season reads just that episode instead of re-reading the whole library.
+
+def load_docs_manifest(frames_base_dir):
+    manifest_path = os.path.join(frames_base_dir, DOCS_MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+        if manifest.get("version") == 1:
+            return manifest
+    return {"version": 1, "seasons": {}, "top": {"parts": [], "size": None}}
+
+def save_docs_manifest(frames_base_dir, manifest):
+    manifest_path = os.path.join(frames_base_dir, DOCS_MANIFEST_NAME)
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(manifest, file, indent=4)
+    os.replace(temp_path, manifest_path)
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def describe_part(name, path, previous=None):
+    """Fingerprint a part file, reusing the previous hash when size and mtime are unchanged."""
+    stat = os.stat(path)
+    part = {"name": name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if previous and previous["name"] == name and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+        part["sha1"] = previous["sha1"]
+    else:
+        part["sha1"] = file_sha1(path)
+    return part
+
+def copy_docs_body(source_path, destination):
+    """Append everything after the header line of `source_path` to `destination`; returns bytes written."""
+    with open(source_path, 'rb') as source:
+        header = source.readline()
+        if header == DOCS_HEADER:
+            start = destination.tell()
+            shutil.copyfileobj(source, destination, 1 << 20)
+            return destination.tell() - start
+    # Not in the layout we write ourselves; normalize it through the csv module instead
+    with open(source_path, 'r', newline='', encoding='utf-8') as csvfile:
+        rows = sorted(csv.DictReader(csvfile), key=docs_row_key)
+    body = io.StringIO()
+    csv.DictWriter(body, fieldnames=DOCS_FIELDNAMES, extrasaction='ignore').writerows(rows)
+    return destination.write(body.getvalue().encode('utf-8'))
+
+def update_aggregate(aggregate_path, parts, previous):
+    """Bring one aggregated _docs.csv up to date with its ordered list of (name, path) parts.
+
+    `previous` is the manifest entry from the last run ({"parts": [...], "size": ...}). Returns
+    the new manifest entry, or None when there are no parts (the aggregate is then removed).
+    """
+    previous = previous or {}
+    previous_parts = previous.get("parts", [])
+    described = [
+        describe_part(name, path, previous_parts[i] if i < len(previous_parts) else None)
+        for i, (name, path) in enumerate(parts)
+    ]
+    if not described:
+        if os.path.exists(aggregate_path):
+            os.remove(aggregate_path)
+        return None
+
+    first_changed = 0
+    if os.path.exists(aggregate_path) and os.path.getsize(aggregate_path) == previous.get("size"):
+        for old, new in zip(previous_parts, described):
+            if (old["name"], old["sha1"]) != (new["name"], new["sha1"]):
+                break
+            new["length"] = old["length"]
+            first_changed += 1
+        if first_changed == len(described) == len(previous_parts):
+            return {"parts": described, "size": previous["size"]}
+
+    offset = len(DOCS_HEADER) + sum(part["length"] for part in described[:first_changed])
+    with open(aggregate_path, 'r+b' if first_changed else 'wb') as aggregate:
+        if not first_changed:
+            aggregate.write(DOCS_HEADER)
+        aggregate.seek(offset)
+        aggregate.truncate()
+        for (name, path), part in zip(parts[first_changed:], described[first_changed:]):
+            part["length"] = copy_docs_body(path, aggregate)
+        size = aggregate.tell()
+    return {"parts": described, "size": size}
+
+def update_aggregated_csv(frames_base_dir):
+    """Incrementally refresh the season-level and top-level _docs.csv files."""
+    manifest = load_docs_manifest(frames_base_dir)
+    seasons = {}
+    top_parts = []
+    for season_dir in sorted(os.listdir(frames_base_dir), key=numeric_sort_key):
+        season_path = os.path.join(frames_base_dir, season_dir)
+        if not os.path.isdir(season_path):
+            continue
+        episode_parts = []
+        for episode_dir in sorted(os.listdir(season_path), key=numeric_sort_key):
+            episode_csv = os.path.join(season_path, episode_dir, '_docs.csv')
+            if os.path.isfile(episode_csv) and os.path.getsize(episode_csv) > 0:
+                episode_parts.append((episode_dir, episode_csv))
+        season_entry = update_aggregate(os.path.join(season_path, '_docs.csv'), episode_parts, manifest["seasons"].get(season_dir))
+        if season_entry:
+            seasons[season_dir] = season_entry
+            top_parts.append((season_dir, os.path.join(season_path, '_docs.csv')))
+
+    manifest["seasons"] = seasons
+    manifest["top"] = update_aggregate(os.path.join(frames_base_dir, '_docs.csv'), top_parts, manifest["top"]) or {"parts": [], "size": None}
+    save_docs_manifest(frames_base_dir, manifest)
+
+def aggregate_docs_csv(frames_base_dir, full=False):
+    # Roll the per-episode _docs.csv files up into one per season, then one for the whole index
+    if not full:
+        update_aggregated_csv(frames_base_dir)
+        return
+    for season_dir in sorted(os.listdir(frames_base_dir), key=numeric_sort_key):
+        season_path = os.path.join(frames_base_dir, season_dir)
+        if os.path.isdir(season_path):
+            season_data = aggregate_csv_data(season_path)
+            write_aggregated_csv(season_data, os.path.join(season_path, '_docs.csv'))
+    top_level_data = aggregate_csv_data(frames_base_dir)
+    write_aggregated_csv(top_level_data, os.path.join(frames_base_dir, '_docs.csv'))
+    # The aggregates were rewritten behind the manifest's back; start the next incremental run fresh
+    manifest_path = os.path.join(frames_base_dir, DOCS_MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+def get_frame_index(time_delta, fps, frame_count=None):
+    starting_index = int(time_delta.total_seconds() * fps) - 1  # Adjust for zero-indexing
+    if frame_count:
+        # Subtitle files often run a little past the end of the video
+        starting_index = min(starting_index, frame_count - 1)
+    return starting_index
+
+def update_processing_status(frames_base_dir, season_num, episode_num, status):
+    get_status_store(frames_base_dir).set_status(season_num, episode_num, status)
+
+def is_episode_processed(frames_base_dir, season_num, episode_num):
+    return get_status_store(frames_base_dir).get_status(season_num, episode_num) == "completed"
+
+# ==================
+# BULK EXPORT
+# ==================
+#
+# Streams the subtitle rows as OpenSearch/Elasticsearch _bulk bodies: an action line and a
+# document line per subtitle, with the text decoded, cut into chunks of at most
+# `max_chunk_bytes` (before optional gzip). Documents get a stable _id (season-episode-index),
+# so re-sending an episode overwrites its documents instead of duplicating them. Rows are read
+# from the per-episode _docs.csv files one line at a time; in incremental mode only episodes
+# whose _docs.csv changed since the last successful export to the same index are sent, as
+# recorded in _export_state.json.
+
+EXPORT_STATE_NAME = "_export_state.json"
+DEFAULT_EXPORT_CHUNK_BYTES = 5 << 20
+
+class BulkExportError(Exception):
+    """Raised when the bulk endpoint keeps refusing a chunk."""
+
+def load_export_state(frames_base_dir, index_name):
+    state_path = os.path.join(frames_base_dir, EXPORT_STATE_NAME)
+    if os.path.exists(state_path):
+        with open(state_path, 'r') as file:
+            state = json.load(file)
+        if state.get("version") == 1 and state.get("index") == index_name:
+            return state
+    return {"version": 1, "index": index_name, "episodes": {}}
+
+def save_export_state(frames_base_dir, state):
+    state_path = os.path.join(frames_base_dir, EXPORT_STATE_NAME)
+    with open(state_path + '.tmp', 'w') as file:
+        json.dump(state, file, indent=4)
+    os.replace(state_path + '.tmp', state_path)
+
+def iter_bulk_chunks(parts, index_name, max_chunk_bytes=DEFAULT_EXPORT_CHUNK_BYTES):
+    """Yield (body, doc_count, finished_parts, chunk_parts) for NDJSON bulk chunks built from (name, csv_path) parts.
+
+    `max_chunk_bytes` may be a callable, read again before every chunk, so an uploader can
+    shrink or grow the chunks while the export runs. `finished_parts` lists the parts whose
+    last row is in this chunk (or an earlier one), i.e. that are fully sent once it succeeds;
+    `chunk_parts` lists the parts with rows in this chunk.
+    """
+    lines, size, docs, finished, touched = [], 0, 0, [], []
+    limit = max_chunk_bytes() if callable(max_chunk_bytes) else max_chunk_bytes
+    for name, csv_path in parts:
+        with open(csv_path, 'r', newline='', encoding='utf-8') as csvfile:
+            for row in csv.DictReader(csvfile):
+                row['subtitle_text'] = base64.b64decode(row['subtitle_text']).decode('utf-8', errors='replace')
+                action = {"index": {"_index": index_name, "_id": f"{row['season']}-{row['episode']}-{row['subtitle_index']}"}}
+                entry = (json.dumps(action, ensure_ascii=False) + "\n" + json.dumps(row, ensure_ascii=False) + "\n").encode('utf-8')
+                if lines and size + len(entry) > limit:
+                    yield b"".join(lines), docs, finished, touched
+                    lines, size, docs, finished, touched = [], 0, 0, [], []
+                    limit = max_chunk_bytes() if callable(max_chunk_bytes) else max_chunk_bytes
+                if not touched or touched[-1] != name:
+                    touched.append(name)
+                lines.append(entry)
+                size += len(entry)
+                docs += 1
+        finished.append(name)
+    if lines or finished:
+        yield b"".join(lines), docs, finished, touched
+
+def split_bulk_body(body, compressed=False):
+    """Split a bulk body into two halves at a document boundary; None when it holds one document."""
+    data = gzip.decompress(body) if compressed else body
+    lines = data.splitlines(keepends=True)
+    documents = len(lines) // 2  # An action line and a source line each
+    if documents < 2:
+        return None
+    middle = (documents // 2) * 2
+    halves = [b"".join(lines[:middle]), b"".join(lines[middle:])]
+    return [gzip.compress(half, compresslevel=5) for half in halves] if compressed else halves
+
+class BulkUploader:
+    """POSTs bulk chunks to `<endpoint>/_bulk`, slowing down when the cluster pushes back.
+
+    429 and 503 responses, and bulk replies whose items were rejected with 429, are retried
+    with exponential backoff (honouring Retry-After) and halve the chunk size. A chunk refused
+    with 413 is split in half at a document boundary and the halves are sent on their own
+    (the chunk size is halved as well). Each clean response lets the chunk size grow back by a quarter, up to `max_chunk_bytes`.
+    Other per-document errors are logged but not retried; a call returns how many documents failed.
+    """
+
+    RETRY_STATUSES = {429, 502, 503, 504}
+
+    def __init__(self, endpoint, user=None, password=None, max_chunk_bytes=DEFAULT_EXPORT_CHUNK_BYTES,
+                 min_chunk_bytes=64 << 10, retries=8, backoff=0.5, max_backoff=60.0, timeout=120):
+        self.url = endpoint.rstrip('/') + '/_bulk'
+        self.headers = {"Content-Type": "application/x-ndjson"}
+        if user or password:
+            token = base64.b64encode(f"{user or ''}:{password or ''}".encode('utf-8')).decode('ascii')
+            self.headers["Authorization"] = f"Basic {token}"
+        self.max_chunk_bytes = max_chunk_bytes
+        self.min_chunk_bytes = min(min_chunk_bytes, max_chunk_bytes)
+        self.chunk_bytes = max_chunk_bytes
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+    def shrink(self):
+        self.chunk_bytes = max(self.min_chunk_bytes, self.chunk_bytes // 2)
+
+    def grow(self):
+        self.chunk_bytes = min(self.max_chunk_bytes, self.chunk_bytes + self.chunk_bytes // 4)
+
+    def wait(self, attempt, retry_after=None):
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        time.sleep(delay)
+
+    def post(self, body, compressed=False):
+        headers = dict(self.headers, **({"Content-Encoding": "gzip"} if compressed else {}))
+        request = urllib.request.Request(self.url, data=body, headers=headers, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read() or b'{}'), None
+        except urllib.error.HTTPError as error:
+            return error.code, None, error.headers.get('Retry-After')
+
+    def __call__(self, body, compressed=False):
+        for attempt in range(self.retries + 1):
+            try:
+                status, reply, retry_after = self.post(body, compressed)
+            except (urllib.error.URLError, OSError) as error:
+                logging.warning(f"Bulk request failed (attempt {attempt + 1}): {error}")
+                self.wait(attempt)
+                continue
+            if status == 413:
+                self.shrink()
+                halves = split_bulk_body(body, compressed)
+                if halves is None:
+                    raise BulkExportError("A single document is too large for the endpoint (HTTP 413)")
+                logging.warning(f"Bulk chunk of {len(body)} bytes too large (HTTP 413); sending it in two halves")
+                return sum(self(half, compressed) for half in halves)
+            if status in self.RETRY_STATUSES:
+                self.shrink()
+                logging.warning(f"Bulk endpoint answered {status}; backing off (chunks now {self.chunk_bytes} bytes)")
+                self.wait(attempt, retry_after)
+                continue
+            if status >= 400:
+                raise BulkExportError(f"Bulk request rejected with HTTP {status}")
+
+            items = [next(iter(item.values())) for item in (reply or {}).get("items", [])]
+            if any(item.get("status") == 429 for item in items):
+                # Some documents were rejected by a full write queue; ids are stable, so resend the chunk
+                self.shrink()
+                self.wait(attempt)
+                continue
+            errors = [item for item in items if item.get("status", 200) >= 300]
+            if errors:
+                logging.error(f"{len(errors)} document(s) failed to index, e.g. {errors[0].get('error')}")
+            self.grow()
+            return len(errors)
+        raise BulkExportError(f"Bulk endpoint still refusing after {self.retries + 1} attempts")
+
+def export_bulk(frames_base_dir, index_name, upload=None, output_dir=None, compress=False, incremental=False,
+                max_chunk_bytes=DEFAULT_EXPORT_CHUNK_BYTES):
+    """Export an index's subtitles as bulk chunks and return a summary dict.
+
+    Each chunk goes to `upload(body, compressed)` (e.g. a BulkUploader; its `chunk_bytes`, if
+    any, sets the chunk size from then on, and it returns the number of documents the endpoint
+    rejected) or, without an uploader, to numbered
+    bulk-NNNNN.ndjson[.gz] files in `output_dir`. A full export replaces the chunk files there;
+    an incremental one numbers its chunks after the ones already there, which may not have been
+    consumed yet. The export state is saved after every chunk,
+    so an interrupted incremental export resumes with the episodes it hadn't finished. Episodes
+    with a rejected document are left out of the state, so the next incremental export resends them.
+    """
+    state = load_export_state(frames_base_dir, index_name)
+    parts, described = [], {}
+    for csv_path in find_episode_csvs(frames_base_dir):
+        name = os.path.relpath(os.path.dirname(csv_path), frames_base_dir).replace(os.sep, '/')
+        part = describe_part(name, csv_path, state["episodes"].get(name))
+        if incremental and state["episodes"].get(name, {}).get("sha1") == part["sha1"]:
+            continue
+        parts.append((name, csv_path))
+        described[name] = part
+    if not incremental:
+        state["episodes"] = {}
+    first_chunk = 1
+    if output_dir:
+        ensure_dir_exists(output_dir)
+        if incremental:
+            numbers = [int(match.group(1)) for match in map(re.compile(r"bulk-([0-9]+)\.ndjson(\.gz)?").fullmatch, os.listdir(output_dir)) if match]
+            first_chunk = max(numbers, default=0) + 1
+        else:
+            clear_outputs(output_dir, r"bulk-[0-9]+\.ndjson(\.gz)?")  # Chunks from an earlier export
+
+    chunk_size = (lambda: upload.chunk_bytes) if hasattr(upload, 'chunk_bytes') else max_chunk_bytes
+    chunks = docs = sent_bytes = failed_documents = 0
+    failed_parts = set()
+    for body, doc_count, finished, chunk_parts in iter_bulk_chunks(parts, index_name, chunk_size):
+        if doc_count:
+            if compress:
+                body = gzip.compress(body, compresslevel=5)
+            if upload:
+                failed = upload(body, compress) or 0
+                if failed:
+                    # Ids are stable, so resending these episodes whole is safe
+                    failed_documents += failed
+                    failed_parts.update(chunk_parts)
+            else:
+                chunk_path = os.path.join(output_dir, f"bulk-{first_chunk + chunks:05d}.ndjson" + (".gz" if compress else ""))
+                with open(chunk_path, 'wb') as chunk_file:
+                    chunk_file.write(body)
+            chunks += 1
+            docs += doc_count
+            sent_bytes += len(body)
+            emit_event("export_progress", chunks=chunks, documents=docs, bytes=sent_bytes)
+        for name in finished:
+            if name in failed_parts:
+                state["episodes"].pop(name, None)
+            else:
+                state["episodes"][name] = described[name]
+        save_export_state(frames_base_dir, state)
+
+    summary = {"index": index_name, "episodes": len(parts), "chunks": chunks, "documents": docs, "bytes": sent_bytes,
+               "failed_documents": failed_documents}
+    logging.info(f"Bulk export: {json.dumps(summary)}")
+    return summary
+
+# ==================
+# LOCAL SEARCH INDEX
+# ==================
+#
+# Built from the top-level _docs.csv into _search/ so quotes can be looked up offline. Jobs don't
+# build it: the first search after _docs.csv changed does, so processing cost stays proportional
+# to the new episodes and libraries that are never searched never pay for an index.
+#   docs.bin      one SEARCH_DOC_RECORD per subtitle row (row number = doc id)
+#   text.bin      the decoded subtitle text the doc records point into
+#   terms.bin     SEARCH_TERM_RECORD per term, sorted by term hash (binary searched in place)
+#   postings.bin  uint32 doc ids, ascending within each term
+#   meta.json     format version, doc count and the size/mtime of the _docs.csv it was built from
+# Terms are the 64-bit blake2b hash of "w:<word>" for every normalized word and "t:<trigram>"
+# for the trigrams of each padded word, which is what fuzzy matching counts. The binary files
+# are memory-mapped by SearchIndex, so a query only touches the pages it needs.
+
+SEARCH_DIR_NAME = "_search"
+SEARCH_INDEX_VERSION = 1
+SEARCH_DOC_RECORD = struct.Struct("<IIIIIQII")  # season, episode, subtitle_index, start_frame, end_frame, text offset, text length, trigram count
+SEARCH_TERM_RECORD = struct.Struct("<QQI")      # term hash, first posting, posting count
+SEARCH_RUN_RECORD = struct.Struct("<QI")        # term hash, doc id (spilled runs only)
+SEARCH_SPILL_POSTINGS = 2_000_000               # postings held in memory before a sorted run is spilled to disk
+SEARCH_MAX_CANDIDATES = 5000                   # lines read back per query when the words are very common
+SEARCH_WORD_PATTERN = re.compile(r"[^\W_]+")
+
+def search_tokens(text):
+    """Lowercase `text`, strip accents and apostrophes and split it into words."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char)).replace("'", "").replace("’", "")
+    return SEARCH_WORD_PATTERN.findall(text)
+
+def word_trigrams(words):
+    trigrams = set()
+    for word in words:
+        padded = f" {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+def term_hash(term):
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+
+def search_index_source(frames_base_dir):
+    docs_csv = os.path.join(frames_base_dir, '_docs.csv')
+    if not os.path.isfile(docs_csv):
+        return None
+    stat = os.stat(docs_csv)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def spill_search_run(pending, directory, runs):
+    path = os.path.join(directory, f"run{len(runs)}.tmp")
+    with open(path, 'wb') as run:
+        for term in sorted(pending):
+            run.write(b"".join(SEARCH_RUN_RECORD.pack(term, doc_id) for doc_id in pending[term]))
+    runs.append(path)
+    pending.clear()
+
+def read_search_run(path):
+    with open(path, 'rb') as run:
+        while True:
+            chunk = run.read(SEARCH_RUN_RECORD.size * 65536)
+            if not chunk:
+                return
+            yield from SEARCH_RUN_RECORD.iter_unpack(chunk)
+
+def build_search_index(frames_base_dir, force=False):
+    """(Re)build _search/ from the top-level _docs.csv; returns the number of documents indexed.
+
+    Rows are streamed; postings are collected per term until SEARCH_SPILL_POSTINGS, spilled as
+    sorted runs and k-way merged at the end, so memory stays flat however big the library is.
+    Nothing is done when the index was already built from the current _docs.csv.
+    """
+    source = search_index_source(frames_base_dir)
+    if source is None:
+        return 0
+    search_dir = os.path.join(frames_base_dir, SEARCH_DIR_NAME)
+    meta_path = os.path.join(search_dir, 'meta.json')
+    if not force and os.path.exists(meta_path):
+        with open(meta_path, 'r') as file:
+            meta = json.load(file)
+        if meta.get("version") == SEARCH_INDEX_VERSION and meta.get("source") == source:
+            return meta["docs"]
+    ensure_dir_exists(search_dir)
+    close_search_index(frames_base_dir)
+
+    pending, pending_count, runs = {}, 0, []
+    doc_id = 0
+    with open(os.path.join(search_dir, 'docs.bin.tmp'), 'wb', buffering=1 << 20) as docs, \
+            open(os.path.join(search_dir, 'text.bin.tmp'), 'wb', buffering=1 << 20) as text_file, \
+            open(os.path.join(frames_base_dir, '_docs.csv'), 'r', newline='', encoding='utf-8') as csvfile:
+        for row in csv.DictReader(csvfile):
+            text = base64.b64decode(row['subtitle_text']).decode('utf-8', errors='replace')
+            encoded = text.encode('utf-8')
+            words = search_tokens(text)
+            trigrams = word_trigrams(words)
+            docs.write(SEARCH_DOC_RECORD.pack(int(row['season']), int(row['episode']), int(row['subtitle_index']),
+                                              max(0, int(row['start_frame'])), max(0, int(row['end_frame'])),
+                                              text_file.tell(), len(encoded), len(trigrams)))
+            text_file.write(encoded)
+            terms = {term_hash(f"w:{word}") for word in words} | {term_hash(f"t:{trigram}") for trigram in trigrams}
+            for term in terms:
+                pending.setdefault(term, []).append(doc_id)
+            pending_count += len(terms)
+            if pending_count >= SEARCH_SPILL_POSTINGS:
+                spill_search_run(pending, search_dir, runs)
+                pending_count = 0
+            doc_id += 1
+
+    in_memory = ((term, doc) for term in sorted(pending) for doc in pending[term])
+    with open(os.path.join(search_dir, 'terms.bin.tmp'), 'wb', buffering=1 << 20) as terms_file, \
+            open(os.path.join(search_dir, 'postings.bin.tmp'), 'wb') as postings_file:
+        current, first, postings = None, 0, array.array('I')
+        written = 0
+        for term, doc in heapq.merge(*(read_search_run(path) for path in runs), in_memory):
+            if term != current:
+                if current is not None:
+                    terms_file.write(SEARCH_TERM_RECORD.pack(current, first, written + len(postings) - first))
+                current, first = term, written + len(postings)
+            postings.append(doc)
+            if len(postings) >= 1 << 20:
+                postings_file.write(postings.tobytes())
+                written += len(postings)
+                postings = array.array('I')
+        if current is not None:
+            terms_file.write(SEARCH_TERM_RECORD.pack(current, first, written + len(postings) - first))
+        postings_file.write(postings.tobytes())
+    for path in runs:
+        os.remove(path)
+
+    for name in ('docs.bin', 'text.bin', 'terms.bin', 'postings.bin'):
+        os.replace(os.path.join(search_dir, name + '.tmp'), os.path.join(search_dir, name))
+    meta = {"version": SEARCH_INDEX_VERSION, "docs": doc_id, "byteorder": sys.byteorder, "source": source}
+    with open(meta_path + '.tmp', 'w') as file:
+        json.dump(meta, file, indent=4)
+    os.replace(meta_path + '.tmp', meta_path)
+    logging.info(f"Search index built: {doc_id} subtitles, {len(runs)} spilled run(s).")
+    return doc_id
+
+class SearchIndex:
+    """Read-only view of an _search/ directory over memory-mapped files."""
+
+    def __init__(self, frames_base_dir):
+        search_dir = os.path.join(frames_base_dir, SEARCH_DIR_NAME)
+        with open(os.path.join(search_dir, 'meta.json'), 'r') as file:
+            self.meta = json.load(file)
+        if self.meta.get("version") != SEARCH_INDEX_VERSION or self.meta.get("byteorder") != sys.byteorder:
+            raise ValueError(f"{search_dir} was built by an incompatible version; rebuild it")
+        self.meta_mtime_ns = os.stat(os.path.join(search_dir, 'meta.json')).st_mtime_ns
+        self.files, self.maps = [], {}
+        for name in ('docs.bin', 'text.bin', 'terms.bin', 'postings.bin'):
+            file = open(os.path.join(search_dir, name), 'rb')
+            self.files.append(file)
+            self.maps[name] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(file.fileno()).st_size else b""
+        self.term_count = len(self.maps['terms.bin']) // SEARCH_TERM_RECORD.size
+        self.postings_view = memoryview(self.maps['postings.bin']).cast('I') if self.maps['postings.bin'] else []
+
+    def close(self):
+        if isinstance(self.postings_view, memoryview):
+            self.postings_view.release()
+        for mapped in self.maps.values():
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+        for file in self.files:
+            file.close()
+
+    def postings(self, term):
+        """Return the ascending doc ids for a term hash (a slice of the mmap, not a copy)."""
+        terms = self.maps['terms.bin']
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if struct.unpack_from("<Q", terms, middle * SEARCH_TERM_RECORD.size)[0] < term:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.term_count:
+            found, first, count = SEARCH_TERM_RECORD.unpack_from(terms, low * SEARCH_TERM_RECORD.size)
+            if found == term:
+                return self.postings_view[first:first + count]
+        return []
+
+    def document(self, doc_id):
+        season_num, episode_num, index, start_frame, end_frame, offset, length, trigrams = \
+            SEARCH_DOC_RECORD.unpack_from(self.maps['docs.bin'], doc_id * SEARCH_DOC_RECORD.size)
+        return {
+            "season": season_num, "episode": episode_num, "subtitle_index": index,
+            "start_frame": start_frame, "end_frame": end_frame,
+            "text": bytes(self.maps['text.bin'][offset:offset + length]).decode('utf-8', errors='replace'),
+            "trigrams": trigrams,
+        }
+
+    def search(self, query, limit=20, min_similarity=0.3):
+        """Return up to `limit` hits for `query`, best first, each a document dict with a "match" and "score".
+
+        Lines containing the words as a phrase rank first, then lines containing all the words,
+        then fuzzy matches by trigram similarity (which absorbs typos and partial words).
+        """
+        words = search_tokens(query)
+        if not words:
+            return []
+        hits = {}
+
+        # Exact: intersect the word posting lists, rarest first
+        word_postings = sorted((self.postings(term_hash(f"w:{word}")) for word in words), key=len)
+        candidates = set(word_postings[0]) if word_postings[0] else set()
+        for postings in word_postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(postings)
+        phrase = f" {' '.join(words)} "
+        for doc_id in sorted(candidates)[:SEARCH_MAX_CANDIDATES]:
+            document = self.document(doc_id)
+            line = f" {' '.join(search_tokens(document['text']))} "
+            coverage = len(phrase) / len(line)
+            if phrase in line:
+                document.update(match="phrase", score=2 + coverage)
+            else:
+                document.update(match="words", score=1 + coverage)
+            hits[doc_id] = document
+
+        # Fuzzy: count shared trigrams, skipping ones so common they would swamp the count
+        if len(hits) < limit:
+            query_trigrams = word_trigrams(words)
+            common = max(50_000, int(self.meta["docs"]) // 20)
+            shared = Counter()
+            for postings in sorted((self.postings(term_hash(f"t:{trigram}")) for trigram in query_trigrams), key=len):
+                if len(postings) > common and shared:
+                    continue
+                shared.update(postings)
+            for doc_id, count in shared.most_common(limit * 20):
+                if doc_id in hits:
+                    continue
+                document = self.document(doc_id)
+                similarity = count / (len(query_trigrams) + document["trigrams"] - count)
+                if similarity >= min_similarity:
+                    document.update(match="fuzzy", score=similarity)
+                    hits[doc_id] = document
+
+        ranked = sorted(hits.values(), key=lambda hit: (-hit["score"], hit["season"], hit["episode"], hit["subtitle_index"]))[:limit]
+        for hit in ranked:
+            hit["score"] = round(hit["score"], 4)
+            del hit["trigrams"]
+        return ranked
+
+search_indexes = {}
+search_indexes_lock = threading.Lock()
+
+def close_search_index(frames_base_dir):
+    with search_indexes_lock:
+        index = search_indexes.pop(frames_base_dir, None)
+    if index:
+        index.close()
+
+def search_subtitles(frames_base_dir, query, limit=20):
+    """Search an index's subtitles offline, (re)building the search index first if _docs.csv has
+    changed since it was built; the mapped index is kept open until it is rebuilt."""
+    if not build_search_index(frames_base_dir):
+        return []
+    meta_path = os.path.join(frames_base_dir, SEARCH_DIR_NAME, 'meta.json')
+    with search_indexes_lock:
+        index = search_indexes.get(frames_base_dir)
+        if index and index.meta_mtime_ns != os.stat(meta_path).st_mtime_ns:
+            search_indexes.pop(frames_base_dir).close()
+            index = None
+        if index is None:
+            index = search_indexes[frames_base_dir] = SearchIndex(frames_base_dir)
+    return index.search(query, limit)
+
+# ==================
+# MEDIA PROBES
+# ==================
+#
+# Every source video is probed once before anything is encoded: duration, native fps,
+# resolution and the stream layout. Probes are cached in ~/.memesrc/cache/media.db keyed by the
+# source fingerprint, so they are shared between jobs and survive renames. ffprobe is used when
+# it sits next to ffmpeg (or is configured as `ffprobe_path`); the ffmpeg-static build bundled
+# with the desktop app has no ffprobe, so otherwise the header `ffmpeg -i` prints is parsed. The
+# same database caches parsed subtitle cues (see SUBTITLE HANDLING).
+
+PROBE_VERSION = 1  # Bump when the probe dict changes shape so stale cache rows are ignored
+PROBE_TIMEOUT_SECONDS = 120
+
+class MediaCache:
+    """SQLite cache of per-source facts (probes and parsed subtitle cues); safe across threads and jobs."""
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS probes (
+            fingerprint TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            probe TEXT NOT NULL,
+            probed_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS cues (
+            source_key TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            cues BLOB NOT NULL,
+            cached_at REAL NOT NULL
+        );
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.local = threading.local()
+        ensure_dir_exists(os.path.dirname(db_path))
+        self.connection().executescript(self.SCHEMA)
+        self.inode = os.stat(self.db_path).st_ino
+
+    def connection(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    def get_probe(self, fingerprint):
+        row = self.connection().execute(
+            'SELECT probe FROM probes WHERE fingerprint = ? AND version = ?', (fingerprint, PROBE_VERSION)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_probe(self, fingerprint, probe):
+        self.connection().execute(
+            'INSERT OR REPLACE INTO probes (fingerprint, version, probe, probed_at) VALUES (?, ?, ?, ?)',
+            (fingerprint, PROBE_VERSION, json.dumps(probe), time.time())
+        )
+
+    def get_cues(self, source_key):
+        """Cached srt.Subtitle list for a subtitle_source_key(), or None."""
+        row = self.connection().execute(
+            'SELECT cues FROM cues WHERE source_key = ? AND version = ?', (source_key, CUE_CACHE_VERSION)
+        ).fetchone()
+        return deserialize_cues(row[0]) if row else None
+
+    def put_cues(self, source_key, subtitles):
+        self.connection().execute(
+            'INSERT OR REPLACE INTO cues (source_key, version, cues, cached_at) VALUES (?, ?, ?, ?)',
+            (source_key, CUE_CACHE_VERSION, serialize_cues(subtitles), time.time())
+        )
+
+media_caches = {}
+media_caches_lock = threading.Lock()
+
+def get_media_cache():
+    db_path = os.path.expanduser(cfg.get('media_cache_path') or "~/.memesrc/cache/media.db")
+    with media_caches_lock:
+        cache = media_caches.get(db_path)
+        if cache is None or not database_is_current(cache):
+            cache = media_caches[db_path] = MediaCache(db_path)
+        return cache
+
+def get_ffprobe_path():
+    if cfg.get('ffprobe_path'):
+        return cfg['ffprobe_path']
+    directory, name = os.path.split(FFMPEG_PATH)
+    return os.path.join(directory, name.replace('ffmpeg', 'ffprobe')) if 'ffmpeg' in name else 'ffprobe'
+
+def parse_frame_rate(value):
+    """'24000/1001' or '23.98' -> 23.976; None for missing or 0/0 rates."""
+    try:
+        numerator, _, denominator = str(value).partition('/')
+        rate = float(numerator) / float(denominator or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return round(rate, 3) if rate > 0 else None
+
+def ffprobe_media(path):
+    result = subprocess.run(
+        [get_ffprobe_path(), "-v", "error", "-print_format", "json", "-show_format", "-show_streams", path],
+        capture_output=True, text=True, errors='replace', timeout=PROBE_TIMEOUT_SECONDS
+    )
+    if result.returncode != 0:
+        return {"error": result.stderr.strip()[-500:] or f"ffprobe exited with {result.returncode}"}
+    info = json.loads(result.stdout or '{}')
+    streams = []
+    for stream in info.get("streams", []):
+        tags = stream.get("tags") or {}
+        entry = {
+            "index": stream.get("index"),
+            "type": stream.get("codec_type"),
+            "codec": stream.get("codec_name"),
+            "language": tags.get("language"),
+            "title": tags.get("title"),
+            "default": bool((stream.get("disposition") or {}).get("default")),
+        }
+        if entry["type"] == "video":
+            entry.update(width=stream.get("width"), height=stream.get("height"),
+                         fps=parse_frame_rate(stream.get("avg_frame_rate")) or parse_frame_rate(stream.get("r_frame_rate")))
+        streams.append(entry)
+    duration = parse_progress_number((info.get("format") or {}).get("duration"))
+    return {"duration": duration, "format": (info.get("format") or {}).get("format_name"), "streams": streams}
+
+FFMPEG_DURATION_PATTERN = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+FFMPEG_STREAM_PATTERN = re.compile(r"Stream #\d+:(\d+)(?:\[\w+\])?(?:\((\w+)\))?: (Video|Audio|Subtitle|Data|Attachment): (\w+)(.*)")
+
+def ffmpeg_header_media(path):
+    """Probe with `ffmpeg -i`, which prints the input's header to stderr and exits without an output."""
+    result = subprocess.run([FFMPEG_PATH, "-hide_banner", "-i", path], capture_output=True, text=True,
+                            errors='replace', timeout=PROBE_TIMEOUT_SECONDS)
+    duration = FFMPEG_DURATION_PATTERN.search(result.stderr)
+    streams = []
+    for match in FFMPEG_STREAM_PATTERN.finditer(result.stderr):
+        index, language, kind, codec, details = match.groups()
+        entry = {"index": int(index), "type": kind.lower(), "codec": codec, "language": language if language != "und" else None,
+                 "title": None, "default": "(default)" in details}
+        if entry["type"] == "video":
+            size = re.search(r", (\d{2,5})x(\d{2,5})", details)
+            rate = re.search(r", ([\d.]+) fps", details)
+            entry.update(width=int(size.group(1)) if size else None, height=int(size.group(2)) if size else None,
+                         fps=parse_frame_rate(rate.group(1)) if rate else None)
+        streams.append(entry)
+    if not duration and not streams:
+        lines = [line for line in result.stderr.strip().splitlines() if line.strip()]
+        return {"error": lines[-1] if lines else f"ffmpeg exited with {result.returncode}"}
+    hours, minutes, seconds = duration.groups() if duration else (0, 0, 0)
+    return {"duration": int(hours) * 3600 + int(minutes) * 60 + float(seconds) or None, "format": None, "streams": streams}
+
+def probe_media(path, store=None):
+    """Duration, stream layout, native fps and resolution of a source file, cached by fingerprint.
+
+    Returns a dict with "duration", "format", "streams" and, for the first video stream,
+    "width", "height" and "fps"; failures come back as {"error": message} and aren't cached.
+    """
+    if os.path.getsize(path) == 0:
+        return {"error": "file is empty"}
+    fingerprint = source_fingerprint(path, store)
+    cache = get_media_cache()
+    probe = cache.get_probe(fingerprint)
+    if probe is not None:
+        return probe
+    try:
+        probe = ffprobe_media(path)
+    except FileNotFoundError:
+        probe = ffmpeg_header_media(path)
+    except (subprocess.TimeoutExpired, json.JSONDecodeError) as error:
+        return {"error": f"ffprobe failed: {error}"}
+    if "error" in probe:
+        return probe
+    video = next((stream for stream in probe["streams"] if stream["type"] == "video"), None)
+    probe.update({key: video.get(key) for key in ("width", "height", "fps")} if video else {"width": None, "height": None, "fps": None})
+    cache.put_probe(fingerprint, probe)
+    return probe
+
+def probe_problem(probe):
+    """Why an episode can't be encoded, or None when its probe looks usable."""
+    if "error" in probe:
+        return probe["error"]
+    if not any(stream["type"] == "video" for stream in probe["streams"]):
+        return "no video stream"
+    if not probe.get("duration") or probe["duration"] <= 0:
+        return "unknown or zero duration"
+    return None
+
+def probe_library(content_files, frames_base_dir, workers=4):
+    """Probe every video of the job in parallel; returns {video_file: probe}."""
+    store = get_status_store(frames_base_dir)
+
+    def probe(video_file):
+        try:
+            return probe_media(video_file, store)
+        except OSError as error:
+            return {"error": str(error)}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        return dict(zip(content_files["videos"], executor.map(probe, content_files["videos"])))
+
+def schedule_episodes(content_files, frames_base_dir, probes):
+    """Reject unusable videos before any encode starts and order the rest longest first.
+
+    Starting the long episodes first keeps a pool of workers from ending on one straggler.
+    Rejected episodes are marked failed and returned as {video_file: reason}.
+    """
+    rejected = {}
+    for video_file, probe in probes.items():
+        problem = probe_problem(probe)
+        if not problem:
+            continue
+        rejected[video_file] = problem
+        season_num, episode_num = episode_key(content_files, video_file)
+        logging.error(f"Skipping {video_file}: {problem}")
+        emit_event("episode_rejected", season=season_num, episode=episode_num, file=video_file, reason=problem)
+        update_processing_status(frames_base_dir, season_num, episode_num, "failed")
+    videos = sorted((video_file for video_file in content_files["videos"] if video_file not in rejected),
+                    key=lambda video_file: -probes[video_file]["duration"])
+    return dict(content_files, videos=videos, probes=probes), rejected
+
+def episode_frame_count(probe, fps):
+    return int(probe["duration"] * fps) if probe.get("duration") else 0
+
+def update_frame_count(frames_base_dir, frame_count):
+    metadata_path = os.path.join(frames_base_dir, '00_metadata.json')
+    if not os.path.exists(metadata_path):
+        return
+    with open(metadata_path, 'r', encoding='utf-8') as file:
+        metadata = json.load(file)
+    metadata["frameCount"] = frame_count
+    temp_path = f"{metadata_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(metadata, file, indent=4)
+    os.replace(temp_path, metadata_path)
+
+# ==================
+# FINGERPRINTS
+# ==================
+#
+# Each episode has two stages whose outputs are reused across runs: "video" (the numbered
+# segments from extract_video_clips) and "subtitles" (the s{N} clips and _docs.csv). A stage's
+# output key hashes everything its output depends on; when the key recorded for the last
+# successful run matches, the stage is skipped. Replacing the SRT only changes the subtitles
+# key, so the expensive full-length encode is left alone.
+
+FINGERPRINT_SAMPLE_SIZE = 1 << 20  # bytes read from the start, middle and end of a source file
+
+def source_fingerprint(path, store=None):
+    """Identify a media file by size, mtime and a hash of three sampled blocks.
+
+    Sampling keeps this cheap on multi-gigabyte rips; the digest is cached in `store` keyed by
+    path, size and mtime so unchanged files aren't read at all on later runs.
+    """
+    stat = os.stat(path)
+    if store is not None:
+        digest = store.cached_fingerprint(path, stat.st_size, stat.st_mtime_ns)
+        if digest:
+            return digest
+    sample = hashlib.blake2b(str(stat.st_size).encode(), digest_size=16)
+    with open(path, 'rb') as file:
+        for offset in (0, max(0, stat.st_size // 2 - FINGERPRINT_SAMPLE_SIZE // 2), max(0, stat.st_size - FINGERPRINT_SAMPLE_SIZE)):
+            file.seek(offset)
+            sample.update(file.read(FINGERPRINT_SAMPLE_SIZE))
+    digest = sample.hexdigest()
+    if store is not None:
+        store.cache_fingerprint(path, stat.st_size, stat.st_mtime_ns, digest)
+    return digest
+
+def output_key(**inputs):
+    return hashlib.sha1(json.dumps(inputs, sort_keys=True).encode()).hexdigest()
+
+def episode_output_keys(episode_file, subtitle_key, fps, clip_duration, clip_store="zip", store=None):
+    """Output keys of the "video" and "subtitles" stages; `subtitle_key` is from subtitle_source_key()."""
+    source = source_fingerprint(episode_file, store)
+    return {
+        "video": output_key(
+            source=source, fps=fps, clip_duration=clip_duration,
+            filter=VIDEO_CLIP_FILTER, codec=VIDEO_CLIP_CODEC_ARGS
+        ),
+        "subtitles": output_key(
+            source=source, subtitles=subtitle_key, fps=fps,
+            buffer=SUBTITLE_CLIP_BUFFER, filter=SUBTITLE_CLIP_FILTER, codec=SUBTITLE_CLIP_CODEC_ARGS,
+            clip_store=clip_store
+        ),
+    }
+
+def clear_outputs(episode_dir, pattern):
+    for filename in os.listdir(episode_dir):
+        if re.fullmatch(pattern, filename):
+            os.remove(os.path.join(episode_dir, filename))
+
+def process_episode(episode_file, frames_base_dir, content_files, fps=10, clip_duration=25, subtitle_extraction="batched", retries=2, clip_store="zip"):
+    season_num, episode_num = episode_key(content_files, episode_file)
+    log = episode_logger(season_num, episode_num)
+    store = get_status_store(frames_base_dir)
+    probe = content_files.get("probes", {}).get(episode_file) or {}
+    frame_count = episode_frame_count(probe, fps)
+
+    subtitle_source = find_subtitle_source(episode_file, content_files, season_num, episode_num)
+    subtitle_key = subtitle_source_key(subtitle_source, store) if subtitle_source else None
+    keys = episode_output_keys(episode_file, subtitle_key, fps, clip_duration, clip_store, store)
+    recorded = {stage: store.get_output_key(season_num, episode_num, stage) for stage in keys}
+
+    # Check if the episode is already processed
+    if is_episode_processed(frames_base_dir, season_num, episode_num):
+        if recorded == {stage: None for stage in keys}:
+            # Completed before fingerprints were recorded; assume it was made with today's inputs
+            for stage, key in keys.items():
+                store.set_output_key(season_num, episode_num, stage, key)
+            recorded = keys
+        if recorded == keys:
+            log.info(f"Skipping Season {season_num}, Episode {episode_num} (already processed).")
+            print(f"Skipping Season {season_num}, Episode {episode_num} (already processed).")
+            return "skipped", 0
+
+    update_processing_status(frames_base_dir, season_num, episode_num, "processing")
+    season_dir = os.path.join(frames_base_dir, str(season_num))
+    ensure_dir_exists(season_dir)
+
+    episode_dir = os.path.join(season_dir, str(episode_num))
+    ensure_dir_exists(episode_dir)
+
+    # A stage's key is recorded under "<stage>:partial" when it starts, so an interrupted run
+    # with the same inputs can keep the clips it finished (see CHECKPOINTS)
+    resume = {stage: store.get_output_key(season_num, episode_num, f"{stage}:partial") == key for stage, key in keys.items()}
+
+    # A stage that is about to change its outputs forgets its recorded key first, so a run that
+    # fails part-way can never leave an older key claiming outputs that are already gone
+    if recorded["video"] == keys["video"]:
+        log.info("Video clips are up to date.")
+    else:
+        store.clear_output_key(season_num, episode_num, "video")
+        if not resume["video"]:
+            store.clear_output_key(season_num, episode_num, "video:partial")
+            clear_outputs(episode_dir, r"(_seg)?[0-9]+\.mp4|_segments\.csv")
+            store.set_output_key(season_num, episode_num, "video:partial", keys["video"])
+        log.info("Extracting video clips.")
+
+        def report_progress(progress):
+            out_time_seconds = (parse_progress_number(progress.get('out_time_us')) or 0) / 1e6
+            emit_event("encode_progress", season=season_num, episode=episode_num, out_time_seconds=out_time_seconds,
+                       percent=round(min(100.0, out_time_seconds / probe["duration"] * 100), 1) if probe.get("duration") else None,
+                       speed=parse_progress_number(progress.get('speed'), 'x'))
+
+        with stage_timer("video", season_num, episode_num):
+            extract_video_clips(episode_file, episode_dir, fps, clip_duration, on_progress=report_progress, resume=resume["video"])
+        store.set_output_key(season_num, episode_num, "video", keys["video"])
+        store.clear_output_key(season_num, episode_num, "video:partial")
+
+    clip_count = 0
+    if recorded["subtitles"] == keys["subtitles"]:
+        log.info("Subtitle clips are up to date.")
+    else:
+        store.clear_output_key(season_num, episode_num, "subtitles")
+        clear_outputs(episode_dir, r"s[0-9]+\.(part\.mp4|zip)|_span[0-9]+\.mp4|_docs\.csv(\.tmp)?|_clips\.(pack|idx)")
+        done = set()
+        if resume["subtitles"]:
+            done = keep_completed_subtitle_clips(episode_dir)
+        else:
+            store.clear_output_key(season_num, episode_num, "subtitles:partial")
+            clear_outputs(episode_dir, r"s[0-9]+\.mp4")
+            store.set_output_key(season_num, episode_num, "subtitles:partial", keys["subtitles"])
+        if subtitle_source:
+            subtitles = load_subtitles(subtitle_source, subtitle_key, store)
+            log.info(f"Extracting subtitle clips from {describe_subtitle_source(subtitle_source)}"
+                     + (f" ({len(done)} of {len(subtitles)} already done)." if done else "."))
+            with stage_timer("subtitles", season_num, episode_num):
+                failed_clips = extract_subtitle_clips(episode_file, subtitles, episode_dir, fps, subtitle_extraction, retries, log, done)
+            clip_count = len(subtitles)
+            if failed_clips:
+                # Don't zip an episode with holes in it; leave it marked failed so the next run redoes it
+                update_processing_status(frames_base_dir, season_num, episode_num, "failed")
+                raise ClipExtractionError(f"{len(failed_clips)} subtitle clip(s) failed for {episode_file}: "
+                                          f"{', '.join(f's{n}' for n in failed_clips)}")
+            csv_path = os.path.join(episode_dir, "_docs.csv")
+            with open(csv_path + '.tmp', 'w', newline='', encoding='utf-8') as csvfile:
+                csv_writer = csv.DictWriter(csvfile, fieldnames=DOCS_FIELDNAMES)
+                csv_writer.writeheader()
+                for index, subtitle in enumerate(subtitles):
+                    start_index = get_frame_index(subtitle.start, fps, frame_count)
+                    end_index = get_frame_index(subtitle.end, fps, frame_count)
+                    encoded_subtitle = base64.b64encode(subtitle.content.encode()).decode()
+                    csv_writer.writerow({
+                        "season": season_num,
+                        "episode": episode_num,
+                        "subtitle_index": index,
+                        "subtitle_text": encoded_subtitle,
+                        "start_frame": start_index,
+                        "end_frame": end_index
+                    })
+            os.replace(csv_path + '.tmp', csv_path)
+        with stage_timer("store", season_num, episode_num):
+            store_video_clips(episode_dir, clip_store)
+        store.set_output_key(season_num, episode_num, "subtitles", keys["subtitles"])
+        store.clear_output_key(season_num, episode_num, "subtitles:partial")
+    # Mark the episode as completed after successful processing
+    update_processing_status(frames_base_dir, season_num, episode_num, "completed")
+    log.info("Episode completed.")
+    return "completed", clip_count
+
+def process_episodes(content_files, frames_base_dir, fps=10, clip_duration=25, workers=1, subtitle_extraction="batched", retries=2, clip_store="zip"):
+    """Run process_episode() over every video, up to `workers` episodes at a time.
+
+    Episodes spend nearly all their time waiting on ffmpeg, so a thread pool is enough to keep
+    the cores busy. A failed episode is logged and marked failed; the next run picks it up again.
+    After a cancel, episodes that haven't started are skipped and the interrupted ones are put
+    back to pending. Returns the list of episode files that failed.
+    """
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(run_episode, episode_file, frames_base_dir, content_files, fps, clip_duration, subtitle_extraction, retries, clip_store): episode_file
+            for episode_file in content_files["videos"]
+        }
+        for future in as_completed(futures):
+            if not episode_succeeded(future, futures[future]):
+                failed.append(futures[future])
+    get_status_store(frames_base_dir).export_json(force=True)
+    return sorted(failed)
+
+def run_episode(episode_file, frames_base_dir, content_files, fps=10, clip_duration=25, subtitle_extraction="batched", retries=2, clip_store="zip"):
+    """process_episode() plus its episode_start/episode events.
+
+    A cancelled episode is put back to pending and one that raised is marked failed, so neither
+    is left showing "processing" once the run is over.
+    """
+    if cancel_requested.is_set():
+        raise JobCancelled()
+    logging.info(f"About to process: {episode_file}")
+    season_num, episode_num = episode_key(content_files, episode_file)
+    emit_event("episode_start", season=season_num, episode=episode_num, file=episode_file)
+    started = time.perf_counter()
+    status, clip_count = "failed", 0
+    try:
+        status, clip_count = process_episode(episode_file, frames_base_dir, content_files, fps, clip_duration, subtitle_extraction, retries, clip_store)
+    except JobCancelled:
+        status = "cancelled"
+        update_processing_status(frames_base_dir, season_num, episode_num, "pending")
+        raise
+    except Exception:
+        update_processing_status(frames_base_dir, season_num, episode_num, "failed")
+        raise
+    finally:
+        episode_dir = os.path.join(frames_base_dir, str(season_num), str(episode_num))
+        record_episode(season_num, episode_num, status, time.perf_counter() - started,
+                       episode_dir if status == "completed" else None, clip_count)
+
+def episode_succeeded(future, episode_file):
+    """Log the outcome of a finished run_episode() future; False when the episode failed.
+
+    A cancelled episode isn't a failure (and JobCancelled is not re-raised).
+    """
+    try:
+        future.result()
+    except JobCancelled:
+        return True
+    except ClipExtractionError as error:
+        logging.error(f"Failed to process: {episode_file}: {error}")
+        return False
+    except Exception:
+        logging.exception(f"Failed to process: {episode_file}")
+        return False
+    return True
+
+# ==================
+# SHARED WORK QUEUE
+# ==================
+#
+# `--queue` lets any number of workers, on one machine or several sharing a filesystem, split a
+# library that writes to the same frames folder (`--frames_dir`). Each episode is a small file
+# under <frames>/_queue/ that moves between state directories with os.rename(), which is atomic
+# on local disks, NFS and SMB alike:
+#
+#   pending/1-3             waiting; the file holds how many attempts it has had
+#   leased/1-3@host-4242    claimed by worker "host-4242", which touches it every heartbeat
+#   done/1-3, failed/1-3    finished; failed once an episode used up QUEUE_MAX_ATTEMPTS
+#
+# A lease whose file hasn't been touched for `lease_seconds` belongs to a crashed worker and is
+# renamed back to pending/ by whoever notices. Times are compared against a file each worker
+# touches itself, so only the file server's clock matters. The first worker seeds pending/
+# (guarded by an O_EXCL "seeded" marker) and the first to see the queue drained runs the final
+# aggregation (guarded by "aggregating"). Delete _queue/ to queue the library again.
+#
+# The queue directory is the only record the workers rely on for who does what. Every worker
+# still writes processing_status.db (statuses, output keys, checkpoints) with a rollback journal,
+# but SQLite's locking over NFS/SMB is only as good as the server's byte-range locks, so across
+# hosts that database is best-effort: a lost write costs at most a redone stage. The worker
+# that aggregates rewrites every episode's final status from done/ and failed/ first, so the
+# exported processing_status.json ends up matching the queue.
+
+QUEUE_DIR_NAME = "_queue"
+QUEUE_STATES = ("pending", "leased", "done", "failed")
+QUEUE_HEARTBEAT_SECONDS = 30
+QUEUE_LEASE_SECONDS = 180
+QUEUE_MAX_ATTEMPTS = 3
+QUEUE_POLL_SECONDS = 5
+
+def create_exclusive(path, content=""):
+    """Create `path` only if it doesn't exist yet; False when another process got there first."""
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as file:
+        file.write(content)
+    return True
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+class WorkQueue:
+    def __init__(self, frames_base_dir, worker_id=None, lease_seconds=QUEUE_LEASE_SECONDS):
+        self.root = os.path.join(frames_base_dir, QUEUE_DIR_NAME)
+        self.worker_id = (worker_id or default_worker_id()).replace(os.sep, "_").replace("@", "_")
+        self.lease_seconds = lease_seconds
+        self.held = set()
+        self.held_lock = threading.Lock()
+        self.stopped = threading.Event()
+        for state in QUEUE_STATES + ("clock",):
+            os.makedirs(os.path.join(self.root, state), exist_ok=True)
+
+    def path(self, state, name):
+        return os.path.join(self.root, state, name)
+
+    def names(self, state):
+        try:
+            return sorted(entry.name for entry in os.scandir(os.path.join(self.root, state)))
+        except FileNotFoundError:
+            return []
+
+    def now(self):
+        """The file server's idea of the current time, read back from a file we just touched."""
+        clock_path = self.path("clock", self.worker_id)
+        with open(clock_path, 'w'):
+            pass
+        return os.stat(clock_path).st_mtime
+
+    def seed(self, episodes):
+        """Queue `episodes` ((season, episode) pairs) unless another worker already did."""
+        seeded_path = os.path.join(self.root, "seeded")
+        ready_path = os.path.join(self.root, "ready")
+        while not os.path.exists(ready_path):
+            if not create_exclusive(seeded_path, self.worker_id):
+                # Someone else is seeding; take over if they died part-way through
+                try:
+                    stale = self.now() - os.stat(seeded_path).st_mtime > self.lease_seconds
+                except FileNotFoundError:
+                    continue
+                if not stale:
+                    time.sleep(0.5)
+                    continue
+                logging.warning("Queue seeding was abandoned; seeding it again")
+            for season_num, episode_num in episodes:
+                create_exclusive(self.path("pending", f"{season_num}-{episode_num}"), "0")
+            create_exclusive(ready_path, self.worker_id)
+        emit_event("queue_ready", worker=self.worker_id, pending=len(self.names("pending")))
+
+    def claim(self, order=None):
+        """Lease the next pending episode (by `order`, a sort key on queue names); returns its
+        queue name or None when nothing is pending."""
+        for name in sorted(self.names("pending"), key=order):
+            lease_path = self.path("leased", f"{name}@{self.worker_id}")
+            try:
+                os.utime(self.path("pending", name))  # The lease is fresh from the moment we take it
+                os.rename(self.path("pending", name), lease_path)
+            except FileNotFoundError:
+                continue  # Another worker claimed it first
+            with self.held_lock:
+                self.held.add(lease_path)
+            return name
+        return None
+
+    def reclaim_expired(self):
+        """Put leases that stopped heartbeating back in pending/, each counting as an attempt."""
+        now = self.now()
+        for lease in self.names("leased"):
+            lease_path = self.path("leased", lease)
+            try:
+                if now - os.stat(lease_path).st_mtime <= self.lease_seconds:
+                    continue
+            except FileNotFoundError:
+                continue
+            name, _, owner = lease.rpartition("@")
+            logging.warning(f"Lease on {name} held by {owner} expired; putting it back in the queue")
+            emit_event("queue_lease_expired", item=name, owner=owner, worker=self.worker_id)
+            self.requeue(lease_path, name)
+
+    def attempts(self, path):
+        try:
+            with open(path) as file:
+                return int(file.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def requeue(self, lease_path, name, count_attempt=True):
+        attempts = self.attempts(lease_path) + (1 if count_attempt else 0)
+        state = "failed" if attempts >= QUEUE_MAX_ATTEMPTS else "pending"
+        try:
+            with open(lease_path, 'w') as file:
+                file.write(str(attempts))
+            os.rename(lease_path, self.path(state, name))
+        except FileNotFoundError:
+            return None  # Someone else already moved it
+        return state
+
+    def release(self, name, ok=None):
+        """Finish a lease: done/ when `ok`, back to pending/ (one more attempt) when not, and
+        back to pending/ without using up an attempt when `ok` is None (cancelled)."""
+        lease_path = self.path("leased", f"{name}@{self.worker_id}")
+        with self.held_lock:
+            self.held.discard(lease_path)
+        if ok:
+            try:
+                os.rename(lease_path, self.path("done", name))
+                return "done"
+            except FileNotFoundError:
+                logging.warning(f"Lease on {name} was reclaimed before it finished; keeping the other worker's result")
+                return None
+        return self.requeue(lease_path, name, count_attempt=ok is not None)
+
+    def heartbeat(self):
+        while not self.stopped.wait(min(QUEUE_HEARTBEAT_SECONDS, self.lease_seconds / 3)):
+            with self.held_lock:
+                held = list(self.held)
+            for lease_path in held:
+                try:
+                    os.utime(lease_path)
+                except FileNotFoundError:
+                    pass
+
+    def final_statuses(self):
+        """(season, episode) -> "completed" or "failed" for every finished queue item."""
+        statuses = {}
+        for state, status in (("done", "completed"), ("failed", "failed")):
+            for name in self.names(state):
+                season_num, _, episode_num = name.partition("-")
+                statuses[(int(season_num), int(episode_num))] = status
+        return statuses
+
+    def is_drained(self):
+        return not self.names("pending") and not self.names("leased")
+
+    @contextmanager
+    def heartbeating(self):
+        thread = threading.Thread(target=self.heartbeat, name="queue-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            self.stopped.set()
+            thread.join()
+
+    def try_aggregate(self, aggregate):
+        """Run `aggregate()` if the queue is drained and no other worker has done or is doing it."""
+        lock_path = os.path.join(self.root, "aggregating")
+        done_path = os.path.join(self.root, "aggregated")
+        if os.path.exists(done_path) or not self.is_drained():
+            return False
+        if not create_exclusive(lock_path, self.worker_id):
+            try:
+                if self.now() - os.stat(lock_path).st_mtime <= self.lease_seconds:
+                    return False
+                os.remove(lock_path)  # The aggregating worker crashed
+            except FileNotFoundError:
+                pass
+            if not create_exclusive(lock_path, self.worker_id):
+                return False
+        with self.held_lock:
+            self.held.add(lock_path)
+        try:
+            aggregate()
+            create_exclusive(done_path, self.worker_id)
+        finally:
+            with self.held_lock:
+                self.held.discard(lock_path)
+            if not os.path.exists(done_path):
+                os.remove(lock_path)
+        return True
+
+def run_queue(content_files, frames_base_dir, fps=10, clip_duration=25, workers=1, subtitle_extraction="batched", retries=2, clip_store="zip",
+              full_aggregate=False, worker_id=None, lease_seconds=QUEUE_LEASE_SECONDS):
+    """Work through the shared queue under `frames_base_dir` until it is drained.
+
+    Returns the episode files this worker gave up on and whether it ran the final aggregation.
+    """
+    work_queue = WorkQueue(frames_base_dir, worker_id, lease_seconds)
+    work_queue.seed(episode_key(content_files, video_file) for video_file in content_files["videos"])
+    videos = {f"{season_num}-{episode_num}": video_file for video_file in content_files["videos"]
+              for season_num, episode_num in [episode_key(content_files, video_file)]}
+
+    def aggregate():
+        for (season_num, episode_num), status in work_queue.final_statuses().items():
+            update_processing_status(frames_base_dir, season_num, episode_num, status)
+        with stage_timer("aggregate"):
+            aggregate_docs_csv(frames_base_dir, full_aggregate)
+
+    probes = content_files.get("probes", {})
+
+    def longest_first(name):
+        return -((probes.get(videos.get(name)) or {}).get("duration") or 0)
+
+    failed = []
+    running = {}
+    with work_queue.heartbeating(), ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        while True:
+            while len(running) < max(1, workers) and not cancel_requested.is_set():
+                name = work_queue.claim(order=longest_first)
+                if name is None:
+                    break
+                video_file = videos.get(name)
+                if video_file is None:
+                    # Queued by a worker that sees a different library; leave it to one that can find it
+                    logging.warning(f"Queued episode {name} isn't in {input_path}; skipping it")
+                    work_queue.release(name, ok=False)
+                    continue
+                emit_event("queue_claim", item=name, worker=work_queue.worker_id)
+                running[executor.submit(run_episode, video_file, frames_base_dir, content_files, fps, clip_duration, subtitle_extraction, retries, clip_store)] = name
+            if not running:
+                if cancel_requested.is_set() or work_queue.is_drained():
+                    break
+                work_queue.reclaim_expired()
+                if not work_queue.names("pending"):
+                    time.sleep(QUEUE_POLL_SECONDS)  # Other workers still hold leases
+                continue
+            finished = next(as_completed(running))
+            name = running.pop(finished)
+            ok = episode_succeeded(finished, videos[name])
+            if isinstance(finished.exception(), JobCancelled):
+                ok = None  # Back to pending without using up an attempt
+            state = work_queue.release(name, ok)
+            if state == "failed":
+                failed.append(videos[name])
+            emit_event("queue_release", item=name, worker=work_queue.worker_id, state=state)
+
+        aggregated = not cancel_requested.is_set() and work_queue.try_aggregate(aggregate)
+    get_status_store(frames_base_dir).export_json(force=True)
+    return sorted(failed), aggregated
+
+# ==================
+# CALIBRATION
+# ==================
+
+def calibrate_encoding_profiles(content_files, output_dir, fps=10, clip_duration=25, sample_seconds=30, sample_count=3, subtitle_clips=10):
+    """Encode a sample of the library with every profile and report encode speed and output size.
+
+    Up to `sample_count` videos spread across the library each contribute a `sample_seconds`
+    excerpt (taken two minutes in when the source is long enough, to skip cold opens) for the
+    segment encode, and up to `subtitle_clips` of their subtitle lines for the clip encode.
+    Results are printed, written to 00_calibration.json and emitted as a "calibration" event.
+    """
+    videos = content_files["videos"]
+    samples = videos[::max(1, len(videos) // sample_count)][:sample_count]
+    if not samples:
+        print("No videos found to calibrate with.")
+        return []
+    threads = encode_plan["video_threads"]
+    results = []
+
+    with tempfile.TemporaryDirectory(dir=output_dir) as scratch:
+        for name in sorted(load_encoding_profiles()):
+            set_encoding_profile(name)
+            video = {"wall_seconds": 0.0, "media_seconds": 0.0, "bytes": 0}
+            subtitles = {"wall_seconds": 0.0, "media_seconds": 0.0, "bytes": 0, "clips": 0}
+            for number, sample in enumerate(samples):
+                output_file = os.path.join(scratch, f"{name}-{number}.mp4")
+                for offset in (120, 0):
+                    started = time.perf_counter()
+                    result = run_ffmpeg([
+                        FFMPEG_PATH, "-y", "-ss", str(offset), "-t", str(sample_seconds), "-i", sample,
+                        "-vf", f"fps={fps},{VIDEO_CLIP_FILTER}", *VIDEO_CLIP_CODEC_ARGS, "-an",
+                        "-threads", str(threads), output_file
+                    ], threads)
+                    if result.returncode == 0 and result.media_seconds > 0:
+                        break
+                if result.returncode != 0 or not clip_is_written(output_file):
+                    logging.warning(f"Calibration encode of {sample} with '{name}' failed: {result.errors[-500:]}")
+                    continue
+                video["wall_seconds"] += time.perf_counter() - started
+                video["media_seconds"] += result.media_seconds
+                video["bytes"] += os.path.getsize(output_file)
+
+                season_num, episode_num = episode_key(content_files, sample)
+                subtitle_file = find_matching_subtitle(sample, content_files, season_num, episode_num)
+                lines = parse_srt(subtitle_file)[:subtitle_clips] if subtitle_file else []
+                windows = [subtitle_clip_window(line) for line in lines] or [(n * 3.0, n * 3.0 + 2.5) for n in range(subtitle_clips)]
+                for clip_number, (start, end) in enumerate(windows, start=1):
+                    started = time.perf_counter()
+                    result = run_ffmpeg(subtitle_clip_command(sample, scratch, clip_number, start, end, fps, threads), threads)
+                    clip_file = subtitle_clip_path(scratch, clip_number)
+                    if result.returncode == 0 and finish_clips(scratch, [clip_number]):
+                        subtitles["wall_seconds"] += time.perf_counter() - started
+                        subtitles["media_seconds"] += end - start
+                        subtitles["bytes"] += os.path.getsize(clip_file)
+                        subtitles["clips"] += 1
+
+            results.append({
+                "profile": name,
+                "video_encode_fps": round(video["media_seconds"] * fps / video["wall_seconds"], 1) if video["wall_seconds"] else None,
+                "video_speed": round(video["media_seconds"] / video["wall_seconds"], 2) if video["wall_seconds"] else None,
+                "bytes_per_segment": int(video["bytes"] / video["media_seconds"] * clip_duration) if video["media_seconds"] else None,
+                "subtitle_encode_fps": round(subtitles["media_seconds"] * fps / subtitles["wall_seconds"], 1) if subtitles["wall_seconds"] else None,
+                "bytes_per_subtitle_clip": int(subtitles["bytes"] / subtitles["clips"]) if subtitles["clips"] else None,
+            })
+
+    print(f"{'profile':<16}{'video fps':>12}{'speed':>8}{'bytes/segment':>16}{'clip fps':>12}{'bytes/clip':>12}")
+    for row in results:
+        print(f"{row['profile']:<16}{row['video_encode_fps'] or '-':>12}{row['video_speed'] or '-':>8}{row['bytes_per_segment'] or '-':>16}"
+              f"{row['subtitle_encode_fps'] or '-':>12}{row['bytes_per_subtitle_clip'] or '-':>12}")
+    with open(os.path.join(output_dir, '00_calibration.json'), 'w') as file:
+        json.dump({"fps": fps, "clip_duration": clip_duration, "sample_seconds": sample_seconds, "samples": samples, "profiles": results}, file, indent=4)
+    emit_event("calibration", profiles=results)
+    return results
+
+def run_job(input_path_param, frames_base_dir, fps=10, clip_duration=25, workers=1, subtitle_extraction="batched", cpu_threads=None, subtitle_jobs=0, retries=2, clip_store="zip", full_aggregate=False,
+            shared_queue=False, worker_id=None, lease_seconds=QUEUE_LEASE_SECONDS):
+    """Discover, encode and aggregate one show into `frames_base_dir`.
+
+    Expects the config, ffmpeg path and encoding profile to be set already. Returns a dict with
+    the job "status" ("completed", "failed" or "cancelled"), the episode count and the failed
+    episode files. Aggregation is skipped for a cancelled job. With `shared_queue` the episodes
+    are split with other workers through the SHARED WORK QUEUE, and only the worker that sees
+    the queue drained aggregates.
+    """
+    run_started = time.perf_counter()
+    reset_run_stats()
+    set_input_path(input_path_param)
+    content_files = list_content_files(use_cache=True)
+    log_discovery_report(content_files)
+    with stage_timer("probe"):
+        probes = probe_library(content_files, frames_base_dir, max(4, workers))
+
+    # Initialize job status with all episodes marked as pending
+    initialize_job_status(content_files, frames_base_dir, probes)
+    emit_event("run_start", id=os.path.basename(frames_base_dir), input_path=input_path_param, episodes=len(content_files["videos"]),
+               media_seconds=round(sum(probe.get("duration") or 0 for probe in probes.values()), 3))
+    content_files, rejected = schedule_episodes(content_files, frames_base_dir, probes)
+
+    set_cpu_budget(cpu_threads or os.cpu_count() or 1, workers, subtitle_jobs)
+    if shared_queue:
+        failed, aggregated = run_queue(content_files, frames_base_dir, fps, clip_duration, workers, subtitle_extraction, retries, clip_store,
+                                       full_aggregate, worker_id, lease_seconds)
+    else:
+        failed = process_episodes(content_files, frames_base_dir, fps, clip_duration, workers, subtitle_extraction, retries, clip_store)
+    failed = sorted(failed + list(rejected))
+    update_frame_count(frames_base_dir, sum(episode_frame_count(probes[video_file], fps) for video_file in content_files["videos"]))
+
+    if cancel_requested.is_set():
+        status = "cancelled"
+        logging.warning("Job cancelled; unfinished episodes were left pending.")
+    elif shared_queue:
+        status = "failed" if failed else "completed"
+        if not aggregated:
+            logging.info("Left the final aggregation to another queue worker.")
+    else:
+        status = "failed" if failed else "completed"
+        # Process CSV data for subtitles at the end, if subtitles were found and processed
+        with stage_timer("aggregate"):
+            aggregate_docs_csv(frames_base_dir, full_aggregate)
+    emit_run_summary(time.perf_counter() - run_started)
+    return {"status": status, "episodes": len(content_files["videos"]) + len(rejected), "failed": failed}
+
+def process_content(input_path_param, id, index_name, title, description, color_main, color_secondary, emoji, status, fps=10, clip_duration=25, workers=1, subtitle_extraction="batched", cpu_threads=None, subtitle_jobs=0, retries=2, clip_store="zip", profile=None, ffmpeg_path=None, subtitle_languages=None):
+    load_config()
+    set_ffmpeg_path(ffmpeg_path)
+    set_subtitle_languages(subtitle_languages)
+    set_encoding_profile(profile)
+    cancel_requested.clear()
+    frames_base_dir = get_frames_dir(id)
+    ensure_dir_exists(frames_base_dir)
+
+    metadata_content = {
+        "id": id,
+        "title": title,
+        "description": description if description else None,
+        "frameCount": 0,  # This should be updated with the actual frame count after processing
+        "colorMain": color_main,
+        "colorSecondary": color_secondary,
+        "emoji": emoji if emoji else None,
+        "status": status,
+        "index_name": index_name  # Keep index_name for backward compatibility or additional indexing purposes
+    }
+    
+    metadata_path = os.path.join(frames_base_dir, '00_metadata.json')
+    with open(metadata_path, 'w') as metadata_file:
+        json.dump(metadata_content, metadata_file)
+
+    return run_job(input_path_param, frames_base_dir, fps, clip_duration, workers, subtitle_extraction, cpu_threads, subtitle_jobs, retries, clip_store)
+
+def write_default_metadata(frames_base_dir, id):
+    # Set metadata directly using the 'id' without collecting user input
+    metadata_content = {
+        'id': id,
+        'index_name': id,  # Use 'id' for 'index_name'
+        'title': id,  # Use 'id' for 'title'
+        'description': 'Auto-generated content',  # Default description
+        'color_main': '#FFFFFF',  # Default white
+        'color_secondary': '#000000',  # Default black
+        'emoji': '🎥',  # Default emoji for video content
+        'status': '1',  # Default status to indicate active or processed
+    }
+
+    # Write the metadata content to the '00_metadata.json' file
+    metadata_path = os.path.join(frames_base_dir, '00_metadata.json')
+    with open(metadata_path, 'w') as metadata_file:
+        json.dump(metadata_content, metadata_file, indent=4)
+
+# ==================
+# WORKER MODE
+# ==================
+#
+# `process-index.py --worker` keeps one interpreter (and its discovery cache) alive across jobs.
+# The status and media databases are reopened for every job, since an output folder can be
+# deleted between two jobs with the same id. Requests are JSON objects, one per line, on stdin:
+#   {"op": "process", "job_id": "a1", "input_path": "/media/Show", "id": "show", "options": {"fps": 10}}
+#   {"op": "cancel", "job_id": "a1"}
+#   {"op": "search", "id": "show", "query": "hello there", "limit": 20}
+#   {"op": "shutdown"}
+# Searches are answered straight away with a "search_results" event, even while a job runs;
+# it carries the search request's own "job_id" (if it had one), never the running job's.
+# Jobs run one at a time in arrival order; "options" takes run_job()'s keyword arguments plus
+# "profile", "ffmpeg_path" and "subtitle_languages". Events go to stdout as JSONL tagged with the job_id, and each job
+# ends with a "job_done" event. Anything else the pipeline prints goes to stderr. The worker
+# exits after "shutdown" or end of input, once the queued jobs are finished.
+
+WORKER_JOB_OPTIONS = {"fps", "clip_duration", "workers", "subtitle_extraction", "cpu_threads", "subtitle_jobs",
+                      "retries", "clip_store", "full_aggregate", "profile", "ffmpeg_path", "subtitle_languages"}
+
+def run_worker_job(request):
+    options = dict(request.get("options") or {})
+    load_config()
+    set_ffmpeg_path(options.pop("ffmpeg_path", None))
+    set_subtitle_languages(options.pop("subtitle_languages", None))
+    set_encoding_profile(options.pop("profile", None))
+    frames_base_dir = get_frames_dir(request["id"])
+    ensure_dir_exists(frames_base_dir)
+    write_default_metadata(frames_base_dir, request["id"])
+    try:
+        with log_to_file(os.path.join(frames_base_dir, '00_log.txt')):
+            logging.info(f"Source: {request['input_path']}")
+            logging.info(f"Destination: {frames_base_dir}")
+            return run_job(request["input_path"], frames_base_dir, **options)
+    finally:
+        # The output folder may be deleted before the next job with the same id
+        forget_cached_stores()
+
+def run_worker(requests=None):
+    """Serve JSON-line requests from `requests` (stdin by default) until shutdown or EOF."""
+    requests = requests or sys.stdin
+    set_event_sink(sys.stdout)
+    sys.stdout = sys.stderr  # Keep stray prints out of the event stream
+    logging.getLogger().setLevel(logging.INFO)
+
+    jobs = queue.Queue()
+    state = {"running": None, "cancelled": set()}
+    state_lock = threading.Lock()
+
+    def work():
+        while True:
+            request = jobs.get()
+            if request is None:
+                return
+            job_id = request["job_id"]
+            with state_lock:
+                if job_id in state["cancelled"]:
+                    state["cancelled"].discard(job_id)
+                    emit_event("job_done", job_id=job_id, status="cancelled")
+                    continue
+                state["running"] = job_id
+                cancel_requested.clear()
+            event_context["job_id"] = job_id
+            try:
+                result = run_worker_job(request)
+                emit_event("job_done", **result)
+            except Exception as error:
+                logging.exception(f"Job {job_id} failed")
+                emit_event("job_done", status="error", error=str(error))
+            finally:
+                event_context.pop("job_id", None)
+                with state_lock:
+                    state["running"] = None
+
+    worker_thread = threading.Thread(target=work, name="index-worker")
+    worker_thread.start()
+    for line in requests:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            op = request["op"]
+        except (ValueError, KeyError, TypeError) as error:
+            emit_event("request_error", job_id=None, error=f"Could not read request: {error}", request=line.strip()[:200])
+            continue
+
+        if op == "process":
+            missing = [field for field in ("job_id", "input_path", "id") if not request.get(field)]
+            unknown = sorted(set(request.get("options") or {}) - WORKER_JOB_OPTIONS)
+            if missing or unknown:
+                emit_event("request_error", job_id=request.get("job_id"),
+                           error=f"Missing {', '.join(missing)}" if missing else f"Unknown options: {', '.join(unknown)}")
+                continue
+            emit_event("job_queued", job_id=request["job_id"])
+            jobs.put(request)
+        elif op == "cancel":
+            with state_lock:
+                if state["running"] is not None and state["running"] == request.get("job_id"):
+                    cancel_running_job()
+                else:
+                    state["cancelled"].add(request.get("job_id"))
+        elif op == "search":
+            # event_context carries the running job's id; a search answer belongs to its own request
+            try:
+                hits = search_subtitles(get_frames_dir(request["id"]), request["query"], int(request.get("limit", 20)))
+                emit_event("search_results", job_id=request.get("job_id"), id=request["id"], query=request["query"], hits=hits)
+            except (KeyError, ValueError, OSError) as error:
+                emit_event("request_error", job_id=request.get("job_id"), id=request.get("id"), error=f"Search failed: {error!r}")
+        elif op == "shutdown":
+            break
+        else:
+            emit_event("request_error", job_id=request.get("job_id"), error=f"Unknown op: {op}")
+
+    jobs.put(None)
+    worker_thread.join()
+
+def check_and_update_metadata(frames_base_dir, id):
+    metadata_path = os.path.join(frames_base_dir, '00_metadata.json')
+    if os.path.exists(metadata_path):
+        edit_metadata = input("Metadata file already exists. Do you want to edit it? [y/N]: ").lower()
+        if edit_metadata == 'y':
+            return collect_metadata(id)
+        else:
+            with open(metadata_path, 'r') as metadata_file:
+                return json.load(metadata_file)
+    else:
+        return collect_metadata(id)
+
+def collect_metadata(id):
+    # Collecting additional details for metadata, now in a separate function
+    index_name_cli = input("Enter the name for the index: ")
+    title_cli = input("Enter the title of the content: ")
+    description_cli = input("Enter the description of the content (optional, press Enter to skip): ")
+    color_main_cli = input("Enter the main color of the content (in HEX format, e.g., #FFFFFF): ")
+    color_secondary_cli = input("Enter the secondary color of the content (in HEX format, e.g., #FFFFFF): ")
+    emoji_cli = input("Enter an emoji representing the content (optional, press Enter to skip): ")
+    status_cli = input("Enter the status of the content (as an integer): ")
+
+    return {
+        "id": id,
+        "title": title_cli,
+        "description": description_cli if description_cli else None,
+        "colorMain": color_main_cli,
+        "colorSecondary": color_secondary_cli,
+        "emoji": emoji_cli if emoji_cli else None,
+        "status": status_cli,
+    }
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    load_config()
+    set_ffmpeg_path(args.ffmpeg_path)
+    set_subtitle_languages(args.subtitle_languages)
+    if args.worker:
+        run_worker()
+        return
+    if args.export:
+        frames_base_dir = get_frames_dir(args.export)
+        export_to = args.export_to or os.path.join(frames_base_dir, '_export')
+        max_chunk_bytes = int(args.export_chunk_mb * (1 << 20))
+        upload = None
+        if export_to.startswith(('http://', 'https://')):
+            upload = BulkUploader(export_to, os.environ.get('OPENSEARCH_USER') or cfg.get('opensearch_user'),
+                                  os.environ.get('OPENSEARCH_PASS'), max_chunk_bytes)
+        set_event_sink(args.events)
+        summary = export_bulk(frames_base_dir, args.export_index or f"v2-{args.export}", upload, None if upload else export_to,
+                              args.export_gzip, args.export_incremental, max_chunk_bytes)
+        print(json.dumps(summary))
+        if summary["failed_documents"]:
+            sys.exit(1)
+        return
+    if args.search:
+        frames_base_dir = get_frames_dir(args.search[0])
+        if not build_search_index(frames_base_dir):
+            parser.error(f"{frames_base_dir} has no subtitles to search")
+        for hit in search_subtitles(frames_base_dir, args.search[1], args.search_limit):
+            print(json.dumps(hit, ensure_ascii=False))
+        return
+    if not args.input_path or not args.id:
+        parser.error("input_path, ffmpeg_path and id are required unless --worker, --search or --export is given")
+
+    frames_base_dir = os.path.abspath(args.frames_dir) if args.frames_dir else get_frames_dir(args.id)
+    ensure_dir_exists(frames_base_dir)
+    set_event_sink(args.events)
+    if args.events == '-':
+        sys.stdout = sys.stderr  # Keep stray prints out of the event stream, as in worker mode
+    if args.queue:
+        # WAL needs shared memory between the processes, which network filesystems can't provide
+        set_status_journal_mode("DELETE")
+
+    # Set up logging
+    log_path = os.path.join(frames_base_dir, '00_log.txt')
+    setup_logging(log_path)
+
+    logging.info(f"Source: {args.input_path}")
+    logging.info(f"Destination: {frames_base_dir}")
+
+    if args.calibrate:
+        set_input_path(args.input_path)
+        set_cpu_budget(args.cpu_budget)
+        calibrate_encoding_profiles(list_content_files(), frames_base_dir, args.fps, args.clip_duration, args.calibrate_seconds)
+        return
+    try:
+        logging.info(f"Encoding profile: {set_encoding_profile(args.profile)}")
+    except ValueError as error:
+        parser.error(str(error))
+
+    write_default_metadata(frames_base_dir, args.id)
+    result = run_job(args.input_path, frames_base_dir, args.fps, args.clip_duration, args.workers, args.subtitle_extraction,
+                     args.cpu_budget, args.subtitle_jobs, args.retries, args.clip_store, args.full_aggregate,
+                     args.queue, args.worker_id, args.lease_seconds)
+
+    # Log the completion of the process; callers tell success from failure by the exit status
+    if result["failed"]:
+        logging.error(f"Processing finished with {len(result['failed'])} failed episode(s): {', '.join(result['failed'])}")
+    elif result["status"] == "completed":
+        logging.info("Processing completed successfully.")
+    if result["failed"] or result["status"] != "completed":
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import base64
+import csv
+import os
+import sys
+import stat
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import process_index  # noqa: E402
+
+@pytest.fixture
+def fake_ffmpeg():
+    path = os.path.join(REPO_DIR, "tests", "fake_ffmpeg.py")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+def write_srt(path, lines):
+    with open(path, "w", encoding="utf-8") as file:
+        for number, text in enumerate(lines, 1):
+            file.write(f"{number}\n00:00:{number:02d},000 --> 00:00:{number:02d},800\n{text}\n\n")
+
+def write_episode_csv(frames_dir, season, episode, lines, fieldnames=None, lineterminator="\r\n"):
+    """Write frames_dir/<season>/<episode>/_docs.csv with one row per subtitle line."""
+    episode_dir = os.path.join(frames_dir, str(season), str(episode))
+    os.makedirs(episode_dir, exist_ok=True)
+    rows = [{
+        "season": season, "episode": episode, "subtitle_index": index,
+        "subtitle_text": base64.b64encode(text.encode()).decode(),
+        "start_frame": index * 10, "end_frame": index * 10 + 9,
+    } for index, text in enumerate(lines)]
+    path = os.path.join(episode_dir, "_docs.csv")
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames or process_index.DOCS_FIELDNAMES, lineterminator=lineterminator)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+@pytest.fixture
+def library(tmp_path):
+    """A small show: S01E01-E04 and S02E01, each a non-empty video with a two-line SRT."""
+    root = tmp_path / "library"
+    root.mkdir()
+    for season, episode in [(1, 1), (1, 2), (1, 3), (1, 4), (2, 1)]:
+        stem = str(root / f"Show.S{season:02d}E{episode:02d}")
+        with open(stem + ".mkv", "wb") as file:
+            file.write(b"video")
+        write_srt(stem + ".srt", [f"Line one of {season}x{episode}", f"Line two of {season}x{episode}"])
+    return str(root)
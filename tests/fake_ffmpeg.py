@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Stand-in for ffmpeg used by the tests: writes the outputs it is asked for instead of encoding.
+
+Handles the invocations process_index makes: header probes (`-i` alone), segment encodes with
+`%d` patterns and `-segment_list`, plain .mp4 outputs, and subtitle demuxes to `pipe:1`.
+FAKE_FFMPEG_SLEEP delays each encode; FAKE_FFMPEG_SEGMENTS sets how many segments an episode has.
+FAKE_FFMPEG_FAIL names an output file (e.g. s3.part.mp4) that is always cut short, failing the run.
+FAKE_FFMPEG_LOG is a file that gets one line per encode listing its output file names.
+"""
+import os
+import re
+import sys
+import time
+
+MP4 = b"\0\0\0\x10ftypmp42\0\0\0\0" + b"\0\0\0\x0cmoov" + b"xxxx" + b"\0\0\0\x6cmdat" + b"x" * 100
+
+def main(args):
+    if len(args) <= 3 and "-i" in args:
+        source = args[args.index("-i") + 1]
+        match = re.search(r"E(\d+)", source)
+        seconds = 60 + 10 * int(match.group(1)) if match else 60
+        sys.stderr.write(f"Input #0, matroska,webm, from '{source}':\n"
+                         f"  Duration: 00:{seconds // 60:02d}:{seconds % 60:02d}.00, start: 0.000000, bitrate: 2000 kb/s\n"
+                         "  Stream #0:0(eng): Video: h264 (High), yuv420p, 1920x1080, 23.98 fps, 23.98 tbr (default)\n"
+                         "At least one output file must be specified\n")
+        return 1
+    if "pipe:1" in args and "-c:s" in args:
+        sys.stdout.write("1\n00:00:01,000 --> 00:00:02,000\nEmbedded line\n\n")
+        return 0
+
+    time.sleep(float(os.environ.get("FAKE_FFMPEG_SLEEP", "0")))
+    start = int(args[args.index("-segment_start_number") + 1]) if "-segment_start_number" in args else 0
+    segment_list = args[args.index("-segment_list") + 1] if "-segment_list" in args else None
+    segments = int(os.environ.get("FAKE_FFMPEG_SEGMENTS", "3"))
+    fail = os.environ.get("FAKE_FFMPEG_FAIL")
+    outputs = [arg for index, arg in enumerate(args) if arg.endswith(".mp4") and args[index - 1] != "-i"]
+    if os.environ.get("FAKE_FFMPEG_LOG"):
+        with open(os.environ["FAKE_FFMPEG_LOG"], "a") as log:
+            log.write(" ".join(os.path.basename(arg) for arg in outputs) + "\n")
+    failed = False
+    for arg in outputs:
+        if "%d" not in arg:
+            failed = failed or os.path.basename(arg) == fail
+            with open(arg, "wb") as output:
+                output.write(MP4[:40] if os.path.basename(arg) == fail else MP4)
+            continue
+        for number in range(start, segments):
+            path = arg.replace("%d", str(number))
+            with open(path, "wb") as output:
+                output.write(MP4)
+            if segment_list:
+                with open(segment_list, "a") as listing:
+                    listing.write(f"{os.path.basename(path)},{number * 25}.0,{(number + 1) * 25}.0\n")
+    if "-progress" in args:
+        print("out_time_us=25000000\nspeed=10x\nprogress=end", flush=True)
+    if failed:
+        sys.stderr.write(f"Error writing trailer of {fail}\n")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
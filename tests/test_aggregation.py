@@ -0,0 +1,122 @@
+"""Incremental aggregation: update_aggregate's truncate/append against a full rebuild."""
+import csv
+import os
+import shutil
+
+import process_index
+
+from conftest import write_episode_csv
+
+def read_bytes(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+def full_rebuild(frames_dir, tmp_path):
+    """A copy of the episode files aggregated from scratch, as `aggregate_docs_csv(full=True)` does."""
+    rebuilt = str(tmp_path / "rebuilt")
+    shutil.rmtree(rebuilt, ignore_errors=True)
+    shutil.copytree(frames_dir, rebuilt)
+    os.remove(os.path.join(rebuilt, process_index.DOCS_MANIFEST_NAME))
+    for season in os.listdir(rebuilt):
+        if os.path.isdir(os.path.join(rebuilt, season)) and os.path.exists(os.path.join(rebuilt, season, "_docs.csv")):
+            os.remove(os.path.join(rebuilt, season, "_docs.csv"))
+    os.remove(os.path.join(rebuilt, "_docs.csv"))
+    process_index.aggregate_docs_csv(rebuilt, full=True)
+    return rebuilt
+
+def assert_matches_full_rebuild(frames_dir, tmp_path):
+    rebuilt = full_rebuild(frames_dir, tmp_path)
+    for season in sorted(name for name in os.listdir(rebuilt) if name.isdigit()):
+        assert read_bytes(os.path.join(frames_dir, season, "_docs.csv")) == read_bytes(os.path.join(rebuilt, season, "_docs.csv"))
+    assert read_bytes(os.path.join(frames_dir, "_docs.csv")) == read_bytes(os.path.join(rebuilt, "_docs.csv"))
+
+def make_library(frames_dir):
+    for season, episodes in ((1, 3), (2, 2)):
+        for episode in range(1, episodes + 1):
+            write_episode_csv(frames_dir, season, episode, [f"S{season}E{episode} line {n}" for n in range(3)])
+
+def test_incremental_matches_full_rebuild(tmp_path):
+    frames_dir = str(tmp_path / "frames")
+    make_library(frames_dir)
+    process_index.update_aggregated_csv(frames_dir)
+    assert_matches_full_rebuild(frames_dir, tmp_path)
+
+def test_changing_a_middle_episode(tmp_path):
+    frames_dir = str(tmp_path / "frames")
+    make_library(frames_dir)
+    process_index.update_aggregated_csv(frames_dir)
+
+    write_episode_csv(frames_dir, 1, 2, ["A much longer replacement line for the middle episode", "and a second one"])
+    process_index.update_aggregated_csv(frames_dir)
+
+    assert_matches_full_rebuild(frames_dir, tmp_path)
+    with open(os.path.join(frames_dir, "_docs.csv"), newline="", encoding="utf-8") as file:
+        rows = list(csv.DictReader(file))
+    assert [(row["season"], row["episode"]) for row in rows].count(("1", "2")) == 2
+    assert [process_index.docs_row_key(row) for row in rows] == sorted(process_index.docs_row_key(row) for row in rows)
+
+def test_removing_the_last_episode(tmp_path):
+    frames_dir = str(tmp_path / "frames")
+    make_library(frames_dir)
+    process_index.update_aggregated_csv(frames_dir)
+
+    shutil.rmtree(os.path.join(frames_dir, "2", "2"))
+    process_index.update_aggregated_csv(frames_dir)
+
+    assert_matches_full_rebuild(frames_dir, tmp_path)
+    with open(os.path.join(frames_dir, "_docs.csv"), newline="", encoding="utf-8") as file:
+        assert not any(row["season"] == "2" and row["episode"] == "2" for row in csv.DictReader(file))
+
+def test_removing_a_whole_season(tmp_path):
+    frames_dir = str(tmp_path / "frames")
+    make_library(frames_dir)
+    process_index.update_aggregated_csv(frames_dir)
+
+    shutil.rmtree(os.path.join(frames_dir, "2"))
+    process_index.update_aggregated_csv(frames_dir)
+
+    assert_matches_full_rebuild(frames_dir, tmp_path)
+
+def test_foreign_header_episode_is_normalized(tmp_path):
+    frames_dir = str(tmp_path / "frames")
+    make_library(frames_dir)
+    process_index.update_aggregated_csv(frames_dir)
+    # Columns in another order and bare \n line endings, as another tool might write them
+    write_episode_csv(frames_dir, 1, 3, ["first", "second", "third"],
+                      fieldnames=["subtitle_text", "season", "episode", "subtitle_index", "start_frame", "end_frame"],
+                      lineterminator="\n")
+    process_index.update_aggregated_csv(frames_dir)
+
+    assert_matches_full_rebuild(frames_dir, tmp_path)
+    season = read_bytes(os.path.join(frames_dir, "1", "_docs.csv"))
+    assert season.count(process_index.DOCS_HEADER) == 1
+    assert b"\r\n1,3,2," in season
+
+def test_foreign_episode_rows_are_sorted(tmp_path):
+    frames_dir = str(tmp_path / "frames")
+    path = write_episode_csv(frames_dir, 1, 1, ["first", "second", "third"],
+                             fieldnames=["episode", "season", "subtitle_index", "subtitle_text", "start_frame", "end_frame"],
+                             lineterminator="\n")
+    with open(path, encoding="utf-8", newline="") as file:
+        header, *rows = file.read().splitlines(keepends=True)
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        file.writelines([header] + rows[::-1])
+
+    process_index.update_aggregated_csv(frames_dir)
+
+    with open(os.path.join(frames_dir, "1", "_docs.csv"), newline="", encoding="utf-8") as file:
+        keys = [process_index.docs_row_key(row) for row in csv.DictReader(file)]
+    assert keys == [(1, 1, 0), (1, 1, 1), (1, 1, 2)]
+    assert read_bytes(os.path.join(frames_dir, "_docs.csv")) == read_bytes(os.path.join(frames_dir, "1", "_docs.csv"))
+
+def test_a_changed_aggregate_is_rebuilt(tmp_path):
+    frames_dir = str(tmp_path / "frames")
+    make_library(frames_dir)
+    process_index.update_aggregated_csv(frames_dir)
+
+    # Something else touched the aggregate; its size no longer matches the manifest
+    with open(os.path.join(frames_dir, "1", "_docs.csv"), "ab") as file:
+        file.write(b"stray bytes\r\n")
+    process_index.update_aggregated_csv(frames_dir)
+
+    assert_matches_full_rebuild(frames_dir, tmp_path)
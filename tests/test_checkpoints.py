@@ -0,0 +1,58 @@
+"""Resuming interrupted clip encodes: which mp4 files count as finished (see CHECKPOINTS)."""
+import os
+
+import process_index
+
+from fake_ffmpeg import MP4
+
+def write(path, data):
+    with open(path, "wb") as file:
+        file.write(data)
+    return str(path)
+
+def test_complete_mp4(tmp_path):
+    assert process_index.mp4_is_complete(write(tmp_path / "whole.mp4", MP4))
+
+def test_truncated_mp4(tmp_path):
+    assert not process_index.mp4_is_complete(write(tmp_path / "cut.mp4", MP4[:-10]))
+    # Cut inside a box header
+    assert not process_index.mp4_is_complete(write(tmp_path / "header.mp4", MP4[:20]))
+
+def test_empty_and_missing_mp4(tmp_path):
+    assert not process_index.mp4_is_complete(write(tmp_path / "empty.mp4", b""))
+    assert not process_index.mp4_is_complete(str(tmp_path / "missing.mp4"))
+
+def test_mp4_without_moov(tmp_path):
+    no_moov = MP4[:16] + b"\0\0\0\x6cmdat" + b"x" * 100
+    assert not process_index.mp4_is_complete(write(tmp_path / "no-moov.mp4", no_moov))
+    # ftyp has to come first
+    moov_first = MP4[16:28] + MP4[:16] + MP4[28:]
+    assert not process_index.mp4_is_complete(write(tmp_path / "moov-first.mp4", moov_first))
+
+def test_settle_stops_at_a_gap_in_the_segment_list(tmp_path):
+    clips_dir = str(tmp_path)
+    for number in (0, 1, 3):
+        write(tmp_path / f"_seg{number}.mp4", MP4)
+    # Segment 2 was never written; segment 4 was still being encoded
+    write(tmp_path / "_seg4.mp4", MP4[:40])
+    with open(tmp_path / process_index.SEGMENT_LIST_NAME, "w") as listing:
+        listing.write("_seg0.mp4,0.0,25.0\n_seg1.mp4,25.0,50.0\n_seg3.mp4,75.0,100.0\n")
+
+    assert process_index.settle_video_segments(clips_dir) == 2
+    assert sorted(os.listdir(clips_dir)) == ["0.mp4", "1.mp4"]
+
+def test_settle_drops_a_truncated_segment(tmp_path):
+    clips_dir = str(tmp_path)
+    write(tmp_path / "0.mp4", MP4)
+    write(tmp_path / "1.mp4", MP4[:-1])
+    write(tmp_path / "2.mp4", MP4)
+
+    assert process_index.settle_video_segments(clips_dir) == 1
+    assert os.listdir(clips_dir) == ["0.mp4"]
+
+def test_settle_with_nothing_finished(tmp_path):
+    clips_dir = str(tmp_path)
+    write(tmp_path / "_seg0.mp4", MP4[:30])
+
+    assert process_index.settle_video_segments(clips_dir) == 0
+    assert os.listdir(clips_dir) == []
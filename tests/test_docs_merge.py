@@ -0,0 +1,31 @@
+"""The sorted k-way merge of episode _docs.csv files (merge_docs_rows) and its de-duplication."""
+import os
+import shutil
+
+import process_index
+
+from conftest import write_episode_csv
+
+def test_merge_docs_rows_interleaves_sorted_sources(tmp_path):
+    frames_dir = str(tmp_path / "frames")
+    first = write_episode_csv(frames_dir, 1, 9, ["a", "b"])
+    second = write_episode_csv(frames_dir, 1, 10, ["c"])
+    earlier = write_episode_csv(frames_dir, 1, 2, ["d", "e", "f"])
+    empty = os.path.join(frames_dir, "empty.csv")
+    with open(empty, "wb") as file:
+        file.write(process_index.DOCS_HEADER)
+
+    keys = [process_index.docs_row_key(row) for row in process_index.merge_docs_rows([second, empty, first, earlier])]
+    # Numeric order: episode 10 sorts after episode 9
+    assert keys == [(1, 2, 0), (1, 2, 1), (1, 2, 2), (1, 9, 0), (1, 9, 1), (1, 10, 0)]
+
+def test_aggregate_csv_data_drops_duplicate_rows(tmp_path):
+    frames_dir = str(tmp_path / "frames")
+    write_episode_csv(frames_dir, 1, 1, ["a", "b"])
+    # A stray copy of the same episode somewhere else in the tree
+    duplicate_dir = os.path.join(frames_dir, "1", "1-copy")
+    os.makedirs(duplicate_dir)
+    shutil.copy(os.path.join(frames_dir, "1", "1", "_docs.csv"), duplicate_dir)
+
+    keys = [process_index.docs_row_key(row) for row in process_index.aggregate_csv_data(frames_dir)]
+    assert keys == [(1, 1, 0), (1, 1, 1)]
@@ -0,0 +1,148 @@
+"""export_bulk and BulkUploader against a local stand-in _bulk endpoint (see BULK EXPORT)."""
+import gzip
+import json
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import process_index
+
+from conftest import REPO_DIR, write_episode_csv
+
+EPISODES = [(1, 1), (1, 2), (1, 3), (2, 1)]
+
+class StandInBulkHandler(BaseHTTPRequestHandler):
+    """Answers the first `throttle` requests with 429, refuses bodies of more than `max_documents`
+    documents with 413 and fails the documents in `reject_ids` with a per-item 400."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        lines = body.splitlines()
+        ids = [json.loads(action)["index"]["_id"] for action in lines[::2]]
+        with server.lock:
+            if server.throttle:
+                server.throttle -= 1
+                server.statuses.append(429)
+                self.send_response(429)
+                self.send_header('Retry-After', '0')
+                self.end_headers()
+                return
+            if server.max_documents is not None and len(ids) > server.max_documents:
+                server.statuses.append(413)
+                self.send_response(413)
+                self.end_headers()
+                return
+            server.statuses.append(200)
+            server.received.extend(ids)
+        items = [{"index": {"_id": doc_id, "status": 400, "error": {"type": "mapper_parsing_exception"}}
+                  if doc_id in server.reject_ids else {"_id": doc_id, "status": 201}} for doc_id in ids]
+        reply = json.dumps({"errors": any(doc_id in server.reject_ids for doc_id in ids), "items": items}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+@pytest.fixture
+def bulk_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInBulkHandler)
+    server.lock = threading.Lock()
+    server.throttle, server.max_documents, server.reject_ids = 0, None, set()
+    server.statuses, server.received = [], []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.endpoint = f"http://127.0.0.1:{server.server_port}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def frames_dir(tmp_path):
+    frames_dir = str(tmp_path / "frames")
+    for season, episode in EPISODES:
+        write_episode_csv(frames_dir, season, episode, [f"S{season}E{episode} line {n}" for n in range(3)])
+    return frames_dir
+
+def all_ids():
+    return sorted(f"{season}-{episode}-{index}" for season, episode in EPISODES for index in range(3))
+
+def uploader(server):
+    return process_index.BulkUploader(server.endpoint, max_chunk_bytes=1000, min_chunk_bytes=100, backoff=0.01)
+
+def test_backs_off_on_429(frames_dir, bulk_server):
+    bulk_server.throttle = 2
+    upload = uploader(bulk_server)
+
+    summary = process_index.export_bulk(frames_dir, "show", upload, compress=True)
+
+    assert bulk_server.statuses[:2] == [429, 429]
+    assert sorted(bulk_server.received) == all_ids()
+    assert summary["documents"] == len(all_ids()) and summary["failed_documents"] == 0
+
+def test_splits_chunks_refused_with_413(frames_dir, bulk_server):
+    bulk_server.max_documents = 2
+    upload = uploader(bulk_server)
+
+    summary = process_index.export_bulk(frames_dir, "show", upload)
+
+    assert 413 in bulk_server.statuses
+    assert sorted(bulk_server.received) == all_ids()
+    assert summary["failed_documents"] == 0
+    assert upload.chunk_bytes < 1000
+
+def test_a_single_document_too_large_fails(frames_dir, bulk_server):
+    bulk_server.max_documents = 0
+    with pytest.raises(process_index.BulkExportError):
+        process_index.export_bulk(frames_dir, "show", uploader(bulk_server))
+
+def test_rejected_documents_are_resent_by_the_next_incremental_export(frames_dir, bulk_server):
+    bulk_server.reject_ids = {"1-2-1"}
+    upload = uploader(bulk_server)
+
+    summary = process_index.export_bulk(frames_dir, "show", upload)
+    assert summary["failed_documents"] == 1
+    with open(os.path.join(frames_dir, process_index.EXPORT_STATE_NAME)) as file:
+        assert "1/2" not in json.load(file)["episodes"]
+
+    bulk_server.reject_ids = set()
+    bulk_server.received.clear()
+    summary = process_index.export_bulk(frames_dir, "show", upload, incremental=True)
+    assert summary["episodes"] >= 1 and summary["failed_documents"] == 0
+    assert {doc_id for doc_id in bulk_server.received if doc_id.startswith("1-2-")} == {"1-2-0", "1-2-1", "1-2-2"}
+
+    bulk_server.received.clear()
+    summary = process_index.export_bulk(frames_dir, "show", upload, incremental=True)
+    assert summary["episodes"] == 0 and bulk_server.received == []
+
+def test_incremental_export_sends_changed_episodes_only(frames_dir, bulk_server):
+    upload = uploader(bulk_server)
+    process_index.export_bulk(frames_dir, "show", upload)
+
+    write_episode_csv(frames_dir, 2, 1, ["a new line", "and another", "and a third", "and a fourth"])
+    bulk_server.received.clear()
+    summary = process_index.export_bulk(frames_dir, "show", upload, incremental=True)
+
+    assert summary["episodes"] == 1
+    assert sorted(bulk_server.received) == ["2-1-0", "2-1-1", "2-1-2", "2-1-3"]
+
+def test_export_exits_1_when_documents_fail(tmp_path, bulk_server):
+    home = str(tmp_path / "home")
+    write_episode_csv(os.path.join(home, ".memesrc", "processing", "show"), 1, 1, ["hello", "there"])
+    bulk_server.reject_ids = {"1-1-0"}
+
+    result = subprocess.run(
+        [sys.executable, os.path.join(REPO_DIR, "process-index.py"), "--export", "show", "--export_to", bulk_server.endpoint],
+        env=dict(os.environ, HOME=home), capture_output=True, text=True
+    )
+
+    assert result.returncode == 1
+    assert json.loads(result.stdout.splitlines()[-1])["failed_documents"] == 1
@@ -0,0 +1,50 @@
+"""Retrying subtitle clip encodes: a clip that keeps failing doesn't cost the rest of its batch."""
+import os
+from datetime import timedelta
+
+import pytest
+import srt
+
+import process_index
+
+def subtitles(count):
+    return [srt.Subtitle(index, timedelta(seconds=2 * index), timedelta(seconds=2 * index + 1.8), f"line {index}")
+            for index in range(1, count + 1)]
+
+def encodes(log_path):
+    with open(log_path) as log:
+        return [line.split() for line in log if line.strip()]
+
+@pytest.fixture
+def failing_clip(tmp_path, fake_ffmpeg, monkeypatch):
+    """Clip 3 never comes out whole; returns the fake ffmpeg's invocation log."""
+    log_path = str(tmp_path / "ffmpeg.log")
+    monkeypatch.setattr(process_index, "FFMPEG_PATH", fake_ffmpeg)
+    monkeypatch.setenv("FAKE_FFMPEG_FAIL", "s3.part.mp4")
+    monkeypatch.setenv("FAKE_FFMPEG_LOG", log_path)
+    return log_path
+
+def test_batch_keeps_finished_clips_and_retries_the_missing_one(tmp_path, failing_clip):
+    episode_dir = str(tmp_path / "clips")
+    os.makedirs(episode_dir)
+
+    failed = process_index.extract_subtitle_clips("Show.S01E01.mkv", subtitles(6), episode_dir, fps=10, mode="batched", retries=2)
+
+    assert failed == [3]
+    assert sorted(os.listdir(episode_dir)) == sorted([f"s{n}.mp4" for n in (1, 2, 4, 5, 6)] + ["s3.part.mp4"])
+    first, *rest = encodes(failing_clip)
+    assert len(first) == 6
+    # Two retries of the batch, then the single-clip fallback's three attempts, all for clip 3 only
+    assert rest == [["s3.part.mp4"]] * 5
+
+def test_span_keeps_finished_clips_and_retries_the_missing_one(tmp_path, failing_clip):
+    episode_dir = str(tmp_path / "clips")
+    os.makedirs(episode_dir)
+
+    failed = process_index.extract_subtitle_clips("Show.S01E01.mkv", subtitles(6), episode_dir, fps=10, mode="coalesced", retries=1)
+
+    assert failed == [3]
+    assert sorted(os.listdir(episode_dir)) == sorted([f"s{n}.mp4" for n in (1, 2, 4, 5, 6)] + ["s3.part.mp4"])
+    copies = [outputs for outputs in encodes(failing_clip) if not outputs[0].startswith("_span")]
+    assert len(copies[0]) == 6
+    assert copies[1:] == [["s3.part.mp4"]] * 3
@@ -0,0 +1,74 @@
+"""Several `process-index.py --queue` processes sharing one frames folder (see SHARED WORK QUEUE)."""
+import json
+import os
+import subprocess
+import sys
+import time
+
+from conftest import REPO_DIR
+
+EPISODES = {"1-1", "1-2", "1-3", "1-4", "2-1"}
+
+def start_worker(library, fake_ffmpeg, frames_dir, worker_id, home, sleep):
+    env = dict(os.environ, HOME=home, FAKE_FFMPEG_SLEEP=str(sleep))
+    return subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, "process-index.py"), library, fake_ffmpeg, "queued",
+         "--queue", "--frames_dir", frames_dir, "--worker_id", worker_id, "--lease_seconds", "2",
+         "--events", os.path.join(home, f"{worker_id}.jsonl")],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+def read_events(home, worker_id):
+    path = os.path.join(home, f"{worker_id}.jsonl")
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def test_workers_share_the_queue(tmp_path, library, fake_ffmpeg):
+    home = str(tmp_path / "home")
+    frames_dir = str(tmp_path / "frames")
+    os.makedirs(home)
+    leased_dir = os.path.join(frames_dir, "_queue", "leased")
+
+    # A worker that takes an episode and then dies without releasing it
+    crasher = start_worker(library, fake_ffmpeg, frames_dir, "crasher", home, sleep=60)
+    deadline = time.monotonic() + 30
+    while not (os.path.isdir(leased_dir) and os.listdir(leased_dir)):
+        assert time.monotonic() < deadline, "the first worker never claimed an episode"
+        time.sleep(0.05)
+    (abandoned,) = [lease.partition("@")[0] for lease in os.listdir(leased_dir)]
+    crasher.kill()
+    crasher.wait()
+
+    workers = ["w1", "w2", "w3"]
+    processes = [start_worker(library, fake_ffmpeg, frames_dir, worker_id, home, sleep=0.2) for worker_id in workers]
+    for process in processes:
+        assert process.wait(timeout=120) == 0
+
+    events = {worker_id: read_events(home, worker_id) for worker_id in workers}
+    all_events = [event for worker_events in events.values() for event in worker_events]
+
+    # Every episode was finished exactly once, and nothing is left in the queue
+    done = [event["item"] for event in all_events if event["event"] == "queue_release" and event["state"] == "done"]
+    assert sorted(done) == sorted(EPISODES)
+    assert set(os.listdir(os.path.join(frames_dir, "_queue", "done"))) == EPISODES
+    assert os.listdir(leased_dir) == []
+    assert os.listdir(os.path.join(frames_dir, "_queue", "pending")) == []
+
+    # The dead worker's lease expired and another worker finished its episode
+    expired = [event for event in all_events if event["event"] == "queue_lease_expired"]
+    assert [(event["item"], event["owner"]) for event in expired] == [(abandoned, "crasher")]
+    assert abandoned in done
+
+    # Exactly one worker ran the final aggregation
+    aggregators = [worker_id for worker_id, worker_events in events.items()
+                   if any(event["event"] == "stage" and event["stage"] == "aggregate" for event in worker_events)]
+    assert len(aggregators) == 1
+    with open(os.path.join(frames_dir, "_queue", "aggregated")) as file:
+        assert file.read() == aggregators[0]
+    assert os.path.exists(os.path.join(frames_dir, "_docs.csv"))
+
+    with open(os.path.join(frames_dir, "processing_status.json")) as file:
+        status = json.load(file)
+    assert status["processed_episodes"] == len(EPISODES)
@@ -0,0 +1,37 @@
+"""`process-index.py --worker`: several jobs served by one long-lived process (see WORKER MODE)."""
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+from conftest import REPO_DIR
+
+def test_same_id_after_output_folder_is_deleted(tmp_path, library, fake_ffmpeg):
+    home = str(tmp_path / "home")
+    os.makedirs(home)
+    worker = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, "process-index.py"), "--worker"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        env=dict(os.environ, HOME=home)
+    )
+
+    def run(job_id):
+        request = {"op": "process", "job_id": job_id, "input_path": library, "id": "show", "options": {"ffmpeg_path": fake_ffmpeg}}
+        worker.stdin.write(json.dumps(request) + "\n")
+        worker.stdin.flush()
+        for line in worker.stdout:
+            event = json.loads(line)
+            if event["event"] == "job_done":
+                return event
+
+    try:
+        frames_dir = os.path.join(home, ".memesrc", "processing", "show")
+        assert run("a")["status"] == "completed"
+        shutil.rmtree(frames_dir)
+        assert run("b")["status"] == "completed"
+        with open(os.path.join(frames_dir, "processing_status.json")) as file:
+            assert json.load(file)["processed_episodes"] == 5
+    finally:
+        worker.stdin.close()
+        worker.wait(timeout=60)